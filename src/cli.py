@@ -0,0 +1,305 @@
+"""
+Headless entry point for render servers (no Qt import, torch only for AI jobs).
+
+    uv run python -m src.cli run jobs.json --workers 4
+    uv run python -m src.cli tune              (benchmark encoders, save the machine profile)
+    uv run python -m src.cli run jobs.json --reprobe-encoders   (after a GPU or driver change)
+    uv run python -m src.cli bench-cpu --save  (benchmark CPU inference options, keep the fastest)
+    uv run python -m src.cli quant-drift       (compare the int8 tier against the float model)
+    uv run python -m src.cli bench-backends    (step time of the torch and ONNX Runtime edit backends)
+
+Manifest: a JSON list of jobs (or {"jobs": [...]}) or a CSV with a header row.
+Every job has a 'mode' plus the same fields the GUI passes to its worker:
+    create_video   img, audio, output, [quality, ladder, still_mode, audio_policy]
+    upscale_video  video, output, [quality, ladder, segments, audio_policy]
+    upscale_images images, output_folder, [quality]
+    concat_images  img1, img2, output
+    ai_edit        img (image or video), prompt, output, [image_guidance_scale, reference_path, steps, process_fps,
+                   edit_every, interpolation (blend|minterpolate), adaptive_anchors,
+                   duplicate_threshold, warp_duplicates, checkpoint, chunk_frames, keep_checkpoint,
+                   batch_size]
+In CSV files list values (images, ladder) are separated with ';'.
+
+One JSON line per finished job is written to stdout. All other logging goes to stderr.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import redirect_stdout
+
+from .core.generator import VideoGenerator
+from .core.ai_video import edit_video, is_video_file
+from .core.gpu_utils import start_encoder_probe
+from .core.encoder_tuner import MIN_SSIM, TUNE_RESOLUTIONS, TUNE_SECONDS, tune_encoders
+from .core.ai_options import BACKENDS, BENCH_SIZE, BENCH_STEPS, DRIFT_PROMPT, DRIFT_STEPS, QUALITY_TIERS
+
+MODES = ('create_video', 'upscale_video', 'upscale_images', 'concat_images', 'ai_edit')
+LIST_FIELDS = ('images', 'ladder')
+BOOL_FIELDS = ('still_mode', 'adaptive_anchors', 'warp_duplicates', 'checkpoint', 'keep_checkpoint')
+INT_FIELDS = ('segments', 'steps', 'edit_every', 'chunk_frames', 'batch_size')
+FLOAT_FIELDS = ('image_guidance_scale', 'process_fps', 'duplicate_threshold')
+
+# The AI engine is a process-wide singleton, so AI jobs run one at a time
+_ai_lock = threading.Lock()
+_ai_engine = None
+_model_budget_gb = None
+_quality_tier = "full"
+_backend = "torch"
+_cpu_options = {}  # CPUInferenceProfile fields overriding the machine's default profile
+
+def _get_ai_engine():
+    global _ai_engine
+    if _ai_engine is None:
+        from .core.ai_editor import AIImageEditor  # Imports torch, only when an AI job needs it
+        _ai_engine = AIImageEditor()
+        _ai_engine.configure_memory(_model_budget_gb)
+        _ai_engine.configure_quality(_quality_tier)
+        _ai_engine.configure_backend(_backend)
+        if _cpu_options and _ai_engine.device == "cpu":
+            from .core.cpu_profile import CPUInferenceProfile
+            _ai_engine.configure_cpu(CPUInferenceProfile.from_dict({**_ai_engine.cpu_profile.to_dict(), **_cpu_options}))
+    return _ai_engine
+
+
+# --- MANIFEST ---
+def _coerce(job):
+    """ Normalizes CSV strings / JSON values into the types the generator expects """
+    job = {k: v for k, v in job.items() if v not in (None, '')}
+    for key in LIST_FIELDS:
+        if isinstance(job.get(key), str):
+            job[key] = [item.strip() for item in job[key].split(';') if item.strip()]
+    for key in BOOL_FIELDS:
+        if isinstance(job.get(key), str):
+            job[key] = job[key].strip().lower() in ('1', 'true', 'yes')
+    for key in INT_FIELDS:
+        if key in job: job[key] = int(job[key])
+    for key in FLOAT_FIELDS:
+        if key in job: job[key] = float(job[key])
+    return job
+
+def load_manifest(path):
+    """ Reads a JSON or CSV manifest into a list of job dicts """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.lower().endswith('.csv'):
+            jobs = list(csv.DictReader(f))
+        else:
+            data = json.load(f)
+            jobs = data['jobs'] if isinstance(data, dict) else data
+
+    jobs = [_coerce(job) for job in jobs]
+    for i, job in enumerate(jobs):
+        if job.get('mode') not in MODES:
+            raise ValueError(f"Job {i}: unknown mode '{job.get('mode')}'. Use one of {MODES}.")
+    return jobs
+
+
+# --- JOBS ---
+def run_job(job):
+    """ Runs one manifest job. Returns the output path(s). """
+    mode = job['mode']
+    generator = VideoGenerator()
+
+    if mode == 'create_video':
+        result = generator.generate_video(
+            job['img'], job['audio'], job['output'], job.get('quality', '1080p'),
+            still_mode=job.get('still_mode', False), audio_policy=job.get('audio_policy', 'auto'),
+            ladder=job.get('ladder')
+        )
+        return result or job['output']
+
+    if mode == 'upscale_video':
+        result = generator.upscale_video(
+            job['video'], job['output'], job.get('quality', '1080p'),
+            audio_policy=job.get('audio_policy', 'auto'), parallel_segments=job.get('segments', 1),
+            ladder=job.get('ladder')
+        )
+        return result or job['output']
+
+    if mode == 'upscale_images':
+        os.makedirs(job['output_folder'], exist_ok=True)
+        generator.upscale_image_batch(job['images'], job['output_folder'], job.get('quality', '4k'))
+        return job['output_folder']
+
+    if mode == 'concat_images':
+        generator.concat_images(job['img1'], job['img2'], job['output'])
+        return job['output']
+
+    # ai_edit
+    with _ai_lock:
+        ai_engine = _get_ai_engine()
+        if is_video_file(job['img']):
+            edit_video(
+                ai_engine, generator, job['img'], job['output'], job['prompt'],
+                image_guidance_scale=job.get('image_guidance_scale', 1.5),
+                reference_path=job.get('reference_path'), steps=job.get('steps', 10),
+                process_fps=job.get('process_fps'), edit_every=job.get('edit_every', 1),
+                interpolation=job.get('interpolation', 'blend'),
+                adaptive_anchors=job.get('adaptive_anchors', False),
+                duplicate_threshold=job.get('duplicate_threshold'),
+                warp_duplicates=job.get('warp_duplicates', False),
+                checkpoint=job.get('checkpoint', False), chunk_frames=job.get('chunk_frames'),
+                keep_checkpoint=job.get('keep_checkpoint', False), batch_size=job.get('batch_size')
+            )
+        else:
+            ai_engine.edit_image(
+                job['img'], job['prompt'], job['output'], steps=job.get('steps', 20),
+                image_guidance_scale=job.get('image_guidance_scale', 1.5),
+                reference_path=job.get('reference_path')
+            )
+    return job['output']
+
+def run_manifest(jobs, workers, results_out):
+    """ Runs jobs on a worker pool, writing one JSON line per job to results_out. Returns the failure count. """
+    write_lock = threading.Lock()
+    failures = 0
+    started = time.perf_counter()
+
+    def timed(index, job):
+        t0 = time.perf_counter()
+        record = {'job': index, 'mode': job['mode']}
+        try:
+            record['output'] = run_job(job)
+            record['status'] = 'ok'
+        except Exception as e:
+            record['status'] = 'error'
+            record['error'] = str(e)
+        record['seconds'] = round(time.perf_counter() - t0, 3)
+        with write_lock:
+            results_out.write(json.dumps(record) + '\n')
+            results_out.flush()
+        return record
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(timed, i, job) for i, job in enumerate(jobs)]
+        for future in as_completed(futures):
+            if future.result()['status'] != 'ok':
+                failures += 1
+
+    summary = {'summary': True, 'jobs': len(jobs), 'failed': failures,
+               'seconds': round(time.perf_counter() - started, 3)}
+    results_out.write(json.dumps(summary) + '\n')
+    results_out.flush()
+    return failures
+
+
+# --- ENTRY POINT ---
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="EC Video Generator (headless)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="Run a JSON/CSV manifest of jobs")
+    run.add_argument('manifest', help="Path to a .json or .csv manifest")
+    run.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                     help="Jobs run in parallel (default: half the CPU cores)")
+    run.add_argument('--model-budget-gb', type=float, default=None,
+                     help="RAM the AI pipelines may hold before least recently used ones are unloaded")
+    run.add_argument('--ai-tier', choices=QUALITY_TIERS, default="full",
+                     help="Edit model quality/speed tier on CPU (int8 = quantized UNet/text encoder)")
+    run.add_argument('--ai-backend', choices=BACKENDS, default="torch",
+                     help="Edit model runtime (onnx = ONNX Runtime on the CPU, needs onnxruntime + onnx). "
+                          "ONNX exports ~3.5 GB of graphs per input resolution to the cache on first use "
+                          "(at most 4 resolutions are kept) and its sessions count against --model-budget-gb")
+    # CPU inference options; unset flags keep the saved bench-cpu profile (or the fp32 default)
+    run.add_argument('--cpu-bf16', action=argparse.BooleanOptionalAction, default=None,
+                     help="bfloat16 weights + autocast (faster on CPUs with native bf16, slightly different output)")
+    run.add_argument('--cpu-channels-last', action=argparse.BooleanOptionalAction, default=None,
+                     help="NHWC memory format for the UNet/VAE")
+    run.add_argument('--cpu-sdpa', action=argparse.BooleanOptionalAction, default=None,
+                     help="Scaled-dot-product attention")
+    run.add_argument('--cpu-compile', action=argparse.BooleanOptionalAction, default=None,
+                     help="torch.compile the UNet (slow first call)")
+    run.add_argument('--cpu-threads', type=int, default=None, help="Intra-op torch threads")
+    run.add_argument('--cpu-interop-threads', type=int, default=None, help="Inter-op torch threads")
+    run.add_argument('--reprobe-encoders', action='store_true',
+                     help="Probe the ffmpeg encoders again instead of using the cached list")
+
+    tune = commands.add_parser('tune', help="Benchmark encoders/presets and save the per-machine profile")
+    tune.add_argument('--presets', nargs='+', choices=list(TUNE_RESOLUTIONS), default=list(TUNE_RESOLUTIONS))
+    tune.add_argument('--seconds', type=int, default=TUNE_SECONDS, help="Length of the synthetic test clip")
+    tune.add_argument('--min-ssim', type=float, default=MIN_SSIM, help="Lowest acceptable SSIM")
+    tune.add_argument('--reprobe-encoders', action='store_true',
+                      help="Probe the ffmpeg encoders again instead of using the cached list")
+
+    bench = commands.add_parser('bench-cpu', help="Benchmark CPU inference options (bf16, channels-last, threads, SDPA, compile)")
+    bench.add_argument('--steps', type=int, default=BENCH_STEPS, help="Timed denoising steps per configuration")
+    bench.add_argument('--size', type=int, default=BENCH_SIZE, help="Side of the synthetic test image")
+    bench.add_argument('--compile', action='store_true', help="Also try torch.compile (slow warm-up)")
+    bench.add_argument('--save', action='store_true', help="Make the fastest configuration this machine's default")
+
+    drift = commands.add_parser('quant-drift', help="Compare int8 edit outputs and step time against the float model")
+    drift.add_argument('--image', help="Input image (default: synthetic noise)")
+    drift.add_argument('--prompt', default=DRIFT_PROMPT)
+    drift.add_argument('--steps', type=int, default=DRIFT_STEPS)
+
+    backends = commands.add_parser('bench-backends', help="Compare edit model step time across inference backends")
+    backends.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    backends.add_argument('--steps', type=int, default=BENCH_STEPS, help="Timed denoising steps per backend")
+    backends.add_argument('--size', type=int, default=BENCH_SIZE, help="Side of the synthetic test image")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    results_out = sys.stdout
+
+    if getattr(args, 'reprobe_encoders', False):
+        with redirect_stdout(sys.stderr):
+            start_encoder_probe(force=True).wait()
+
+    if args.command == 'run':
+        global _model_budget_gb, _quality_tier, _backend, _cpu_options
+        _cpu_options = {field: value for field, value in (
+            ('bf16', args.cpu_bf16), ('channels_last', args.cpu_channels_last), ('sdpa', args.cpu_sdpa),
+            ('compile', args.cpu_compile), ('intra_threads', args.cpu_threads), ('inter_threads', args.cpu_interop_threads),
+        ) if value is not None}
+        _model_budget_gb = args.model_budget_gb
+        _quality_tier = args.ai_tier
+        _backend = args.ai_backend
+        jobs = load_manifest(args.manifest)
+        # Keep stdout machine-readable: every log line from the core goes to stderr
+        with redirect_stdout(sys.stderr):
+            failures = run_manifest(jobs, args.workers, results_out)
+        return 1 if failures else 0
+
+    if args.command == 'tune':
+        with redirect_stdout(sys.stderr):
+            profile = tune_encoders(args.presets, args.seconds, args.min_ssim)
+        results_out.write(json.dumps(profile['presets'], indent=2) + '\n')
+
+    if args.command == 'bench-cpu':
+        from .core.cpu_profile import benchmark_cpu_profiles, benchmark_profiles
+        with redirect_stdout(sys.stderr):
+            engine = _get_ai_engine()
+            if engine.device != "cpu":
+                print("CUDA is available; the CPU profile is not used on this machine.")
+                return 1
+            results = benchmark_cpu_profiles(engine, benchmark_profiles(args.compile), args.steps, args.size, args.save)
+        for result in results:
+            results_out.write(json.dumps(result) + '\n')
+
+    if args.command == 'quant-drift':
+        from PIL import Image
+        from .core.quantization import compare_quantized_drift
+        with redirect_stdout(sys.stderr):
+            engine = _get_ai_engine()
+            if engine.device != "cpu":
+                print("CUDA is available; the int8 tier is CPU only.")
+                return 1
+            image = Image.open(args.image).convert('RGB') if args.image else None
+            report = compare_quantized_drift(engine, image, args.prompt, args.steps)
+        results_out.write(json.dumps(report) + '\n')
+
+    if args.command == 'bench-backends':
+        from .core.edit_backends import benchmark_backends
+        with redirect_stdout(sys.stderr):
+            results = benchmark_backends(_get_ai_engine(), args.backends, args.steps, args.size)
+        for result in results:
+            results_out.write(json.dumps(result) + '\n')
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
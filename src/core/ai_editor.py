@@ -1,4 +1,5 @@
 import os
+import threading
 import torch
 from PIL import Image, ImageOps
 from diffusers import (
@@ -8,61 +9,232 @@ from diffusers import (
 )
 from diffusers.utils import export_to_video
 
+from .cpu_profile import CPUInferenceProfile
+from .edit_backends import TorchEditBackend, create_backend
+from .job_store import file_hash
+from .lru_cache import LRUCache
+from .memory_utils import available_device_bytes
+from .resolution_buckets import EDIT_BUCKET_SIDES, ResolutionBucketer, bucket_sizes
+from .quantization import QUALITY_TIERS, load_quantized_modules, quantize_pipeline
+from .model_manager import ModelManager
+
+EDIT_MODEL_ID = "timbrooks/instruct-pix2pix"
+VIDEO_MODEL_ID = "vdo/stable-video-diffusion-img2vid-xt-1-1"
+VIDEO_MODEL_FALLBACK_ID = "mkshing/svd-xt"
+
+# Approximate float32 RAM per pipeline (halved in float16), used to plan evictions before loading
+MODEL_BYTES = {'edit': 4.3e9, 'video': 9.5e9}
+PROMPT_CACHE_SIZE = 64
+IMAGE_CACHE_ENTRIES = 32
+IMAGE_CACHE_BYTES = 256 * 1024 * 1024
+
+# Rough activation memory per working pixel for one image through the pix2pix UNet
+# (three classifier-free guidance branches). Used to size batches.
+EDIT_BYTES_PER_PIXEL = {torch.float16: 3000, torch.bfloat16: 3000, torch.float32: 6000}
+MAX_BATCH_SIZE = 8
+WORKING_SIZE = 768
+GUIDANCE_SCALE = 7.5
+# Stable Video Diffusion's native 1024x576 frame, in landscape and portrait
+VIDEO_BUCKETS = bucket_sizes((1024,), (16 / 9,))
+
+def _image_entry_bytes(entry):
+    image, _, latents = entry
+    return image.width * image.height * 3 + latents.numel() * latents.element_size()
+
+def _is_oom(error):
+    message = str(error).lower()
+    return 'out of memory' in message or "can't allocate memory" in message
+
 class AIImageEditor:
     _instance = None
+    # Serializes model loading and pipeline calls (the GUI warm-up thread shares the engine)
+    _lock = threading.RLock()
 
     def __new__(cls):
-        if cls._instance is None:
-            print("Initializing AI Engine Wrapper...")
-            cls._instance = super(AIImageEditor, cls).__new__(cls)
-            cls._instance.device = "cuda" if torch.cuda.is_available() else "cpu"
-            cls._instance.edit_pipe = None
-            cls._instance.video_pipe = None
-        return cls._instance
+        with cls._lock:
+            if cls._instance is None:
+                print("Initializing AI Engine Wrapper...")
+                cls._instance = super(AIImageEditor, cls).__new__(cls)
+                cls._instance.device = "cuda" if torch.cuda.is_available() else "cpu"
+                cls._instance.cpu_profile = CPUInferenceProfile.default() if cls._instance.device == "cpu" else None
+                cls._instance.quality_tier = "full"
+                cls._instance.backend = TorchEditBackend(cls._instance)
+                cls._instance.models = ModelManager()
+                dtype_scale = 0.5 if cls._instance.device == "cuda" else 1.0
+                cls._instance.models.register('edit', cls._instance._build_edit_pipe, MODEL_BYTES['edit'] * dtype_scale)
+                cls._instance.models.register('video', cls._instance._build_video_pipe, MODEL_BYTES['video'] * dtype_scale)
+                cls._instance.batch_cap = MAX_BATCH_SIZE  # Lowered for good after an OOM
+                cls._instance.prompt_cache = LRUCache("Prompt embedding", PROMPT_CACHE_SIZE)
+                cls._instance.image_cache = LRUCache("Input image", IMAGE_CACHE_ENTRIES, IMAGE_CACHE_BYTES, _image_entry_bytes)
+                cls._instance.edit_buckets = ResolutionBucketer("Edit", bucket_sizes(EDIT_BUCKET_SIDES), mode="pad")
+                cls._instance.video_buckets = ResolutionBucketer("Video", VIDEO_BUCKETS, mode="crop")
+            return cls._instance
+
+    # --- MODELS ---
+    @property
+    def edit_pipe(self):
+        """ InstructPix2Pix pipeline, loaded on first use (may be evicted by the memory budget) """
+        return self.models.get('edit')
+
+    @property
+    def video_pipe(self):
+        """ SVD pipeline, loaded on first use (may be evicted by the memory budget) """
+        return self.models.get('video')
+
+    def configure_memory(self, budget_gb=None):
+        """ Sets the RAM budget for loaded pipelines (None = default share of physical RAM) """
+        if budget_gb:
+            self.models.set_budget(int(budget_gb * 1e9))
+
+    def configure_cpu(self, profile):
+        """ Switches the CPU inference profile; loaded pipelines are dropped so they reload with it """
+        if self.device != "cpu":
+            return
+        with self._lock:
+            self.cpu_profile = profile
+            self.models.unload()
+            # Cached embeddings/latents were computed in the old dtype
+            self.prompt_cache.clear()
+            self.image_cache.clear()
+            self.edit_buckets.reset_warm()
+            self.video_buckets.reset_warm()
+        print(f"CPU inference profile: {profile.name}")
+
+    def configure_quality(self, tier):
+        """
+        Quality/speed tier of the edit model on CPU:
+        - 'full': float weights (see the CPU profile).
+        - 'int8': dynamically quantized UNet + text encoder Linear layers, cached on disk.
+        """
+        if tier not in QUALITY_TIERS:
+            raise ValueError(f"Unknown quality tier '{tier}'. Use one of {QUALITY_TIERS}.")
+        if self.device != "cpu":
+            if tier != "full":
+                print("int8 tier is CPU only; keeping the float16 CUDA model.")
+            return
+        with self._lock:
+            if tier == self.quality_tier:
+                return
+            self.quality_tier = tier
+            self.models.unload('edit')
+            self.prompt_cache.clear()
+            self.image_cache.clear()
+            self.edit_buckets.reset_warm()
+        print(f"Edit model quality tier: {tier}")
+        self._warn_ignored_options()
+
+    def configure_backend(self, name):
+        """
+        Inference backend of the edit model:
+        - 'torch': the diffusers pipeline (CPU profile / quality tier apply).
+        - 'onnx': ONNX Runtime on the CPU, with graphs exported once and cached on disk.
+          Always float32: the int8 tier and the CPU profile's bf16 do not apply to it.
+        """
+        if self.device != "cpu" and name != "torch":
+            create_backend(name, self)  # Still rejects unknown names
+            print(f"{name} backend is CPU only; keeping the CUDA torch pipeline.")
+            return
+        with self._lock:
+            if name == self.backend.name:
+                return
+            backend = create_backend(name, self)
+            self.backend.unload()
+            self.models.unload('edit')
+            self.backend = backend
+            self.prompt_cache.clear()
+            self.image_cache.clear()
+            self.edit_buckets.reset_warm()
+        print(f"Edit model backend: {name}")
+        self._warn_ignored_options()
+
+    def _warn_ignored_options(self):
+        if self.backend.name == "torch":
+            return
+        if self.quality_tier != "full":
+            print(f"Quality tier '{self.quality_tier}' does not apply to the {self.backend.name} backend (runs float32).")
+        if self.cpu_profile and self.cpu_profile.bf16:
+            print(f"bf16 from the CPU profile does not apply to the {self.backend.name} backend (runs float32).")
+
+    def _quantized(self):
+        return self.device == "cpu" and self.quality_tier == "int8"
+
+    def _model_dtype(self):
+        if self.device == "cuda":
+            return torch.float16
+        return torch.float32 if self._quantized() else self.cpu_profile.dtype
+
+    def _autocast(self):
+        if self.device != "cpu":
+            return torch.autocast(self.device)
+        return torch.autocast("cpu", enabled=False) if self._quantized() else self.cpu_profile.autocast()
+
+    def unload(self, name=None):
+        """ Frees the 'edit' or 'video' pipeline, or both """
+        with self._lock:
+            self.models.unload(name)
+            if name in (None, 'edit'):
+                self.backend.unload()
+                self.edit_buckets.reset_warm()
+            if name in (None, 'video'):
+                self.video_buckets.reset_warm()
+        print(self.models.summary())
 
     def _load_edit_model(self):
         """ Loads InstructPix2Pix (Image Editing) """
-        if self.edit_pipe is not None: return
+        with self._lock:
+            self.backend.load()
 
+    def _build_edit_pipe(self):
         print("Loading Edit Model (InstructPix2Pix)...")
-        dtype = torch.float16 if self.device == "cuda" else torch.float32
+        dtype = self._model_dtype()
+        quantized = self._quantized()
+        cached = load_quantized_modules(EDIT_MODEL_ID) if quantized else None
         
-        self.edit_pipe = StableDiffusionInstructPix2PixPipeline.from_pretrained(
-            "timbrooks/instruct-pix2pix", 
+        pipe = StableDiffusionInstructPix2PixPipeline.from_pretrained(
+            EDIT_MODEL_ID, 
             torch_dtype=dtype, 
-            safety_checker=None
+            safety_checker=None,
+            **(cached or {})
         )
-        self.edit_pipe.scheduler = EulerAncestralDiscreteScheduler.from_config(self.edit_pipe.scheduler.config)
+        pipe.scheduler = EulerAncestralDiscreteScheduler.from_config(pipe.scheduler.config)
+        if quantized and cached is None:
+            quantize_pipeline(pipe, EDIT_MODEL_ID)
         
         if self.device == "cuda":
-            self.edit_pipe.enable_model_cpu_offload()
+            pipe.enable_model_cpu_offload()
+        else:
+            self.cpu_profile.apply(pipe, quantized=quantized)
+        return pipe
 
     def _load_video_model(self):
         """ Loads SVD (Image to Video) from an OPEN MIRROR """
-        if self.video_pipe is not None: return
+        with self._lock:
+            self.models.get('video')
 
+    def _build_video_pipe(self):
         print("Loading Video Model (SVD Open Mirror)...")
-        dtype = torch.float16 if self.device == "cuda" else torch.float32
-        
-        model_id = "vdo/stable-video-diffusion-img2vid-xt-1-1" 
+        dtype = self._model_dtype()
         
         try:
-            self.video_pipe = StableVideoDiffusionPipeline.from_pretrained(
-                model_id, 
+            pipe = StableVideoDiffusionPipeline.from_pretrained(
+                VIDEO_MODEL_ID, 
                 torch_dtype=dtype, 
                 variant="fp16"
             )
         except Exception as e:
             print(f"Mirror download failed, trying fallback... Error: {e}")
-            self.video_pipe = StableVideoDiffusionPipeline.from_pretrained(
-                "mkshing/svd-xt", 
+            pipe = StableVideoDiffusionPipeline.from_pretrained(
+                VIDEO_MODEL_FALLBACK_ID, 
                 torch_dtype=dtype, 
                 variant="fp16"
             )
         
         if self.device == "cuda":
-            self.video_pipe.enable_model_cpu_offload() 
-            self.video_pipe.unet.enable_forward_chunking()
+            pipe.enable_model_cpu_offload() 
+            pipe.unet.enable_forward_chunking()
+        else:
+            self.cpu_profile.apply(pipe)
+        return pipe
 
     def _overlay_image(self, bg_image, ref_path):
         """ Pastes the reference image onto the background for the AI to fix """
@@ -92,44 +264,169 @@ class AIImageEditor:
             print(f"Overlay Error: {e}")
             return bg_image.convert("RGB")
 
-    def edit_image(self, image_path, prompt, output_path, steps=20, image_guidance_scale=1.5, reference_path=None, status_callback=None):
-        """ 
-        Runs the Image Edit.
-        - reference_path: Optional path to an image to 'add' to the scene.
-        """
-        self._load_edit_model()
-             
-        input_image = Image.open(image_path)
-        input_image = ImageOps.exif_transpose(input_image).convert("RGB")
+    def _prepare_image(self, image, reference_path=None):
+        """ EXIF transpose, optional reference overlay and downscale to the model's working size """
+        input_image = ImageOps.exif_transpose(image).convert("RGB")
         
         # --- NEW: APPLY REFERENCE OVERLAY ---
         if reference_path:
-            print(f"Applying Reference Image: {reference_path}")
             input_image = self._overlay_image(input_image, reference_path)
         
-        max_dim = 768
+        max_dim = WORKING_SIZE
         if max(input_image.size) > max_dim:
              input_image.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+        return input_image
 
-        def pipe_callback(step, timestep, latents):
+    def _encode_text(self, text):
+        """ CLIP embedding of one prompt, kept on the CPU (the backend moves it per call) """
+        with self._lock:
+            return self.backend.encode_text(text)
+
+    def _prompt_embeds(self, prompt):
+        """ (prompt, unconditional) embeddings from the LRU cache, encoded on a miss """
+        return (
+            self.prompt_cache.get_or_create((EDIT_MODEL_ID, prompt), lambda: self._encode_text(prompt)),
+            self.prompt_cache.get_or_create((EDIT_MODEL_ID, ""), lambda: self._encode_text("")),
+        )
+
+    def _encode_images(self, input_images):
+        """ VAE latents of prepared, same-size images (the mode, so they are deterministic), kept on the CPU """
+        with self._lock:
+            return self.backend.encode_images(input_images)
+
+    def _cached_input(self, image_path, reference_path=None, cancel_event=None):
+        """
+        Prepared image, its bucket placement and latents, reused while the file, overlay and working size stay the same.
+        Returns None if cancel_event is set before the VAE encode.
+        """
+        reference_key = None
+        if reference_path and os.path.exists(reference_path):
+            reference_key = (os.path.abspath(reference_path), file_hash(reference_path))
+        key = (EDIT_MODEL_ID, file_hash(image_path), reference_key, WORKING_SIZE)
+
+        cached = self.image_cache.get(key)
+        if cached is None:
+            input_image, placement = self.edit_buckets.fit(self._prepare_image(Image.open(image_path), reference_path))
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            cached = (input_image, placement, self._encode_images([input_image]))
+            self.image_cache.put(key, cached)
+        return cached
+
+    def warm_up(self, image_path=None, reference_path=None, cancel_event=None):
+        """
+        Speculative preparation while the user is still typing the prompt: loads the edit model,
+        encodes the unconditional prompt and caches the image's preprocessing and latents, so
+        the next edit_image on it only pays for denoising. If the image's bucket is still cold and
+        the backend pays a one-time cost per shape (ONNX export, torch.compile), one denoising
+        step is run on it as well.
+        - cancel_event: threading.Event checked between stages; set it when the selection changes.
+        Returns True if everything was prepared, False if cancelled.
+        """
+        def cancelled():
+            return cancel_event is not None and cancel_event.is_set()
+
+        self._load_edit_model()
+        if cancelled():
+            return False
+        self.prompt_cache.get_or_create((EDIT_MODEL_ID, ""), lambda: self._encode_text(""))
+        if not image_path or cancelled():
+            return not cancelled()
+        cached = self._cached_input(image_path, reference_path, cancel_event)
+        if cached is None:
+            return False
+        _, placement, latents = cached
+        shape_bound = self.backend.name == "onnx" or (self.cpu_profile is not None and self.cpu_profile.compile)
+        if shape_bound and not self.edit_buckets.is_warm(placement['bucket']) and not cancelled():
+            self._run_edit(latents, "", 1, 1.5)
+            self.edit_buckets.mark_warm(placement['bucket'])
+        return not cancelled()
+
+    def _run_edit(self, image_latents, prompt, steps, image_guidance_scale, status_callback=None, seed=None):
+        """ One backend denoising run over a batch of image latents (no VAE encode inside) """
+        def step_callback(step):
             if status_callback: status_callback(step, steps)
 
-        with torch.autocast(self.device):
-            res = self.edit_pipe(
-                prompt, image=input_image, num_inference_steps=steps, 
-                guidance_scale=7.5, 
-                image_guidance_scale=image_guidance_scale, 
-                callback=pipe_callback, callback_steps=1 
-            ).images[0]
+        prompt_embeds, negative_embeds = self._prompt_embeds(prompt)
+        count = image_latents.shape[0]
+        with self._lock:
+            return self.backend.denoise(
+                image_latents, prompt_embeds.repeat(count, 1, 1), negative_embeds.repeat(count, 1, 1),
+                steps, GUIDANCE_SCALE, image_guidance_scale, step_callback, seed
+            )
+
+    def edit_frame(self, image, prompt, steps=20, image_guidance_scale=1.5, reference_path=None, status_callback=None, seed=None):
+        """
+        Same as edit_image, but takes and returns an in-memory PIL image (used by the video pipeline).
+        - seed: Fixes the sampler noise (for reproducible comparisons).
+        """
+        self._load_edit_model()
+        input_image, placement = self.edit_buckets.fit(self._prepare_image(image, reference_path))
+        result = self._run_edit(self._encode_images([input_image]), prompt, steps, image_guidance_scale, status_callback, seed)[0]
+        self.edit_buckets.mark_warm(placement['bucket'])
+        return self.edit_buckets.restore(result, placement)
 
-        res.save(output_path)
+    def auto_batch_size(self, size=(WORKING_SIZE, WORKING_SIZE)):
+        """ Largest batch of `size` frames that fits in the free device memory (at least 1) """
+        dtype = self._model_dtype()
+        free = available_device_bytes(self.device)
+        if not free:
+            return 1
+        per_image = size[0] * size[1] * EDIT_BYTES_PER_PIXEL[dtype]
+        return max(1, min(self.batch_cap, int(free * 0.8) // per_image))
+
+    def edit_batch(self, images, prompt, steps=20, image_guidance_scale=1.5, reference_path=None, status_callback=None, batch_size=None):
+        """
+        Edits a list of same-size in-memory frames with as few pipeline calls as possible.
+        - batch_size: Frames per UNet call (default: sized from free memory). Halved on OOM.
+        Returns the edited PIL images in input order.
+        """
+        self._load_edit_model()
+        fitted = [self.edit_buckets.fit(self._prepare_image(image, reference_path)) for image in images]
+        if not fitted:
+            return []
+        inputs = [image for image, _ in fitted]
+
+        # batch_cap also bounds explicit sizes, so an OOM-lowered cap sticks for the session
+        size = min(batch_size or self.auto_batch_size(inputs[0].size), self.batch_cap, len(inputs))
+        results = []
+        while len(results) < len(inputs):
+            chunk = inputs[len(results):len(results) + size]
+            try:
+                results.extend(self._run_edit(self._encode_images(chunk), prompt, steps, image_guidance_scale, status_callback))
+            except RuntimeError as e:  # CUDA OOM errors subclass RuntimeError too
+                if size == 1 or not _is_oom(e):
+                    raise
+                size //= 2
+                self.batch_cap = min(self.batch_cap, size)
+                print(f"Out of memory, retrying with batch size {size}")
+                if self.device == "cuda":
+                    torch.cuda.empty_cache()
+        self.edit_buckets.mark_warm(fitted[0][1]['bucket'])
+        return [self.edit_buckets.restore(result, placement) for result, (_, placement) in zip(results, fitted)]
+
+    def edit_image(self, image_path, prompt, output_path, steps=20, image_guidance_scale=1.5, reference_path=None, status_callback=None):
+        """ 
+        Runs the Image Edit.
+        - reference_path: Optional path to an image to 'add' to the scene.
+        Re-editing the same picture reuses its preprocessing and VAE latents (see image_cache).
+        """
+        if reference_path:
+            print(f"Applying Reference Image: {reference_path}")
+
+        self._load_edit_model()
+        _, placement, image_latents = self._cached_input(image_path, reference_path)
+        res = self._run_edit(image_latents, prompt, steps, image_guidance_scale, status_callback)[0]
+        self.edit_buckets.mark_warm(placement['bucket'])
+        self.edit_buckets.restore(res, placement).save(output_path)
 
     def animate_image(self, image_path, output_path, steps=25, status_callback=None):
         self._load_video_model()
 
         input_image = Image.open(image_path).convert("RGB")
         input_image = ImageOps.exif_transpose(input_image)
-        input_image = input_image.resize((1024, 576), Image.Resampling.LANCZOS)
+        # Cropped to the closest SVD bucket instead of stretched; the clip keeps the bucket size
+        input_image, placement = self.video_buckets.fit(input_image)
 
         def pipe_callback(pipe, step, timestep, callback_kwargs):
             if status_callback: status_callback(step, steps)
@@ -137,11 +434,13 @@ class AIImageEditor:
 
         frames = self.video_pipe(
             input_image, 
+            width=placement['bucket'][0], height=placement['bucket'][1],
             decode_chunk_size=2, 
             num_inference_steps=steps,
             motion_bucket_id=127, 
             generator=torch.manual_seed(42),
             callback_on_step_end=pipe_callback 
         ).frames[0]
+        self.video_buckets.mark_warm(placement['bucket'])
 
         export_to_video(frames, output_path, fps=7)
\ No newline at end of file
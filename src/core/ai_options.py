@@ -0,0 +1,17 @@
+"""
+Choices and defaults of the AI engine options, kept free of torch imports so the CLI and the
+GUI can build their argument lists / combos without loading the models.
+"""
+
+QUALITY_TIERS = ("full", "int8")
+BACKENDS = ("torch", "onnx")
+
+# CPU profile / backend benchmarks
+BENCH_STEPS = 4
+BENCH_SIZE = 512
+BENCH_PROMPT = "make it look like a watercolor painting"
+
+# int8 drift check
+DRIFT_PROMPT = BENCH_PROMPT
+DRIFT_STEPS = 10
+DRIFT_SEED = 1234
@@ -0,0 +1,211 @@
+import os
+import time
+
+from .frame_pipeline import FramePipeline, QUEUE_SIZE
+from .frame_similarity import DuplicateFrameSkipper
+from .job_store import ChunkedFrameWriter, EditJobStore
+from .temporal import INTERPOLATION_MODES, TemporalSubsampler
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov')
+
+def is_video_file(path):
+    return path.lower().endswith(VIDEO_EXTENSIONS)
+
+def edit_video(ai_engine, generator, input_path, output_path, prompt, image_guidance_scale=1.5,
+               reference_path=None, steps=10, progress_callback=None, log_callback=print, queue_size=QUEUE_SIZE,
+               process_fps=None, edit_every=1, interpolation="blend", adaptive_anchors=False,
+               duplicate_threshold=None, warp_duplicates=False,
+               checkpoint=False, chunk_frames=None, keep_checkpoint=False, checkpoint_root=None,
+               batch_size=None):
+    """
+    Runs the AI edit over every frame of a video and reassembles it with the original audio.
+    Frames stream from an ffmpeg decode pipe, through the model, into an ffmpeg encode pipe
+    that muxes the audio in the same pass (nothing is written to disk). Decode, inference and
+    encode run concurrently (see FramePipeline), so the wall time tracks the slowest stage.
+    - reference_path: Optional image overlaid on every frame (static).
+    - progress_callback: Optional fn(done_frames, total_frames), called as frames are encoded.
+    - queue_size: Frames buffered between stages (caps memory).
+    - process_fps: Optional rate to decimate to before editing (default: the source's native rate).
+    - edit_every: Only send every Kth frame through the model and interpolate the rest on the CPU.
+    - interpolation: 'blend' (cross-fade edited anchors) or 'minterpolate' (ffmpeg motion-compensated
+      interpolation at encode time, fixed K only).
+    - adaptive_anchors: With 'blend', also edit frames that drift too far from the last anchor.
+    - duplicate_threshold: Frames this close (0-255 mean difference) to the last edited frame reuse
+      its output instead of running the model (lossy; DUPLICATE_THRESHOLD is a good start).
+      0/None (default) disables the check.
+    - warp_duplicates: Also reuse the last output, shifted, for frames that are a small pan of it.
+    - checkpoint: Save every model output to a job folder (see EditJobStore) so a rerun with the
+      same input, prompt and parameters skips the finished frames. Removed after success
+      unless keep_checkpoint is set. Off by default: it hashes the input and writes a PNG per frame.
+    - chunk_frames: Bulk mode. Encode the output in chunks of this many frames as they finish
+      and join them (plus the audio) at the end. Implies checkpoint.
+    - batch_size: Frames per model call when every frame is edited (default: sized from free
+      memory by the engine, halved on OOM). 1 disables batching. Blend subsampling edits
+      its anchors one at a time, since each span needs the previous anchor's output.
+    Kept free of Qt and torch imports so the GUI and the CLI can share it.
+    """
+    if interpolation not in INTERPOLATION_MODES:
+        raise ValueError(f"Unknown interpolation '{interpolation}'. Use one of {INTERPOLATION_MODES}.")
+    if chunk_frames and edit_every > 1 and interpolation == "minterpolate":
+        raise ValueError("Chunked output cannot be combined with minterpolate (it would break at chunk boundaries).")
+
+    reader = generator.read_frames(input_path, fps=process_fps)
+    video_filter = None
+    use_minterpolate = edit_every > 1 and interpolation == "minterpolate"
+    if use_minterpolate:
+        # Decode only the anchors; ffmpeg synthesizes the in-between frames while encoding
+        output_fps = reader.fps
+        reader = generator.read_frames(input_path, fps=output_fps / edit_every)
+        video_filter = f"minterpolate=fps={output_fps:.6f}:mi_mode=mci"
+
+    total_frames = reader.frame_count
+    expected_edits = max(1, total_frames // edit_every) if edit_every > 1 and not use_minterpolate else total_frames
+    log_callback(f"Streaming ~{total_frames} frames at {reader.fps:.3f} fps...")
+
+    store = None
+    if checkpoint or chunk_frames:
+        params = {
+            'steps': steps, 'image_guidance_scale': image_guidance_scale,
+            'reference_path': os.path.abspath(reference_path) if reference_path else None,
+            'process_fps': process_fps, 'edit_every': edit_every, 'interpolation': interpolation,
+            'adaptive_anchors': adaptive_anchors, 'duplicate_threshold': duplicate_threshold,
+            'warp_duplicates': warp_duplicates, 'chunk_frames': chunk_frames,
+            # Resumed frames must come from the same model variant as the new ones
+            'quality_tier': ai_engine.quality_tier, 'backend': ai_engine.backend.name,
+        }
+        store = EditJobStore(input_path, prompt, params, root=checkpoint_root, log_callback=log_callback)
+
+    edit_stats = {'frames': 0, 'calls': 0, 'restored': 0, 'seconds': 0.0}
+    position = {'index': -1}  # Source frame currently in the inference stage
+
+    def run_model(frame):
+        index = position['index']
+        if store and store.has_frame(index):
+            edit_stats['restored'] += 1
+            return store.load_frame(index)
+
+        edit_stats['calls'] += 1
+        start = time.perf_counter()
+        result = ai_engine.edit_frame(
+            frame, prompt,
+            steps=steps,
+            image_guidance_scale=image_guidance_scale,
+            reference_path=reference_path
+        )
+        edit_stats['seconds'] += time.perf_counter() - start
+        if store:
+            store.save_frame(index, result)
+        return result
+
+    skipper = None
+    if duplicate_threshold:
+        skipper = DuplicateFrameSkipper(run_model, threshold=duplicate_threshold, warp=warp_duplicates,
+                                        log_callback=log_callback)
+
+    def edit_one(frame):
+        edit_stats['frames'] += 1
+        log_callback(f"AI Edit: Frame {edit_stats['frames']}/~{max(expected_edits, edit_stats['frames'])}")
+        return skipper(frame) if skipper else run_model(frame)
+
+    def flush(entries, size):
+        todo = [e for e in entries if e['out'] is None and e['ref'] is None]
+        if todo:
+            log_callback(f"AI Edit: Frames {todo[0]['index'] + 1}-{todo[-1]['index'] + 1}/~{expected_edits} "
+                         f"(batch of {len(todo)})")
+            start = time.perf_counter()
+            outputs = ai_engine.edit_batch(
+                [e['frame'] for e in todo], prompt,
+                steps=steps,
+                image_guidance_scale=image_guidance_scale,
+                reference_path=reference_path,
+                batch_size=size
+            )
+            edit_stats['seconds'] += time.perf_counter() - start
+            edit_stats['calls'] += len(todo)
+            for entry, output in zip(todo, outputs):
+                entry['out'] = output
+                if store:
+                    store.save_frame(entry['index'], output)
+        for entry in entries:
+            entry['frame'] = None
+            if entry['out'] is None:
+                entry['out'] = skipper.reuse(entry['ref']['out'], entry['shift'])
+            yield entry['out']
+
+    def edit_batches(frames):
+        size = batch_size or ai_engine.auto_batch_size()
+        log_callback(f"Batching up to {size} frames per model call")
+        entries, reference, pending = [], None, 0
+        for index, frame in enumerate(frames):
+            size = min(size, ai_engine.batch_cap)  # Lowered by the engine after an OOM
+            edit_stats['frames'] += 1
+            entry = {'index': index, 'frame': frame, 'out': None, 'ref': None, 'shift': None}
+            shift = skipper.check(frame) if skipper else None
+            if shift is not None:
+                entry['ref'], entry['shift'] = reference, shift
+            else:
+                reference = entry
+                if store and store.has_frame(index):
+                    edit_stats['restored'] += 1
+                    entry['out'] = store.load_frame(index)
+                else:
+                    pending += 1
+            entries.append(entry)
+            # Also flush long runs of duplicates so the encoder is not starved
+            if pending >= size or len(entries) >= size * 4:
+                yield from flush(entries, size)
+                entries, pending = [], 0
+        yield from flush(entries, size)
+
+    if edit_every > 1 and not use_minterpolate:
+        edit_frames = TemporalSubsampler(edit_one, every=edit_every, adaptive=adaptive_anchors, log_callback=log_callback).process
+    elif batch_size == 1:
+        def edit_frames(frames):
+            for frame in frames:
+                yield edit_one(frame)
+    else:
+        edit_frames = edit_batches
+
+    def indexed(frames):
+        # Runs on the inference thread, so the index always matches the frame being edited
+        for index, frame in enumerate(frames):
+            position['index'] = index
+            yield frame
+
+    def process(frames):
+        return edit_frames(indexed(frames))
+
+    if chunk_frames:
+        writer = ChunkedFrameWriter(generator, store, reader.fps, chunk_frames)
+    else:
+        writer = generator.open_frame_writer(output_path, reader.fps, audio_source=input_path, video_filter=video_filter)
+
+    with writer:
+        def encode(frame):
+            writer.write(frame)
+            if progress_callback:
+                progress_callback(writer.frames_written, max(total_frames, writer.frames_written))
+
+        FramePipeline(reader, process, encode, queue_size=queue_size, log_callback=log_callback).run()
+
+    if chunk_frames:
+        chunks = store.finished_chunks()
+        log_callback(f"Joining {len(chunks)} chunks...")
+        generator.concat_video_chunks(chunks, input_path, output_path)
+    if store:
+        if edit_stats['restored']:
+            log_callback(f"Checkpoint: restored {edit_stats['restored']} frames from job {store.job_id}")
+        store.finish(keep=keep_checkpoint)
+
+    if use_minterpolate:
+        per_edit = edit_stats['seconds'] / edit_stats['calls'] if edit_stats['calls'] else 0.0
+        log_callback(
+            f"Temporal K={edit_every} (minterpolate): edited {edit_stats['calls']} anchors, "
+            f"{edit_every}x fewer model calls (~{per_edit * edit_stats['calls'] * (edit_every - 1):.0f}s saved); "
+            f"in-between frames are motion-compensated by ffmpeg"
+        )
+    if skipper:
+        skipper.report()
+    log_callback(ai_engine.prompt_cache.summary())
+    log_callback(ai_engine.edit_buckets.summary())
+    log_callback(f"Encoded {writer.frames_written} frames to {output_path}")
@@ -0,0 +1,17 @@
+import os
+import sys
+
+APP_NAME = "ECVideoGenerator"
+
+def get_cache_dir(*parts):
+    """ Returns (and creates) a per-user cache folder, e.g. ~/.cache/ECVideoGenerator/<parts> """
+    if sys.platform == 'win32':
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+
+    path = os.path.join(base, APP_NAME, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,201 @@
+import json
+import os
+import platform
+import time
+
+import torch
+from PIL import Image
+
+from .ai_options import BENCH_PROMPT, BENCH_SIZE, BENCH_STEPS
+from .app_paths import get_cache_dir
+from .memory_utils import PeakRSSSampler, current_rss_bytes
+
+PROFILE_FILE = "cpu_profile.json"
+
+def cpu_supports_bf16():
+    """ True when the CPU has native bfloat16 math (AVX512-BF16 / AMX on x86, BF16 on ARM) """
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            flags = f.read()
+        return any(flag in flags for flag in ('avx512_bf16', 'amx_bf16', ' bf16'))
+    except OSError:
+        pass
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+class CPUInferenceProfile:
+    """
+    How the diffusion pipelines run when there is no CUDA device.
+    - bf16: bfloat16 weights + autocast (only worth it with native bf16 support).
+    - channels_last: NHWC memory format for the UNet/VAE convolutions.
+    - intra_threads / inter_threads: torch thread pools (None = torch default).
+    - sdpa: scaled-dot-product attention processors (False = classic attention, for comparison).
+    - compile: torch.compile the UNet (slow first call, faster steps afterwards).
+    """
+    def __init__(self, bf16=False, channels_last=False, intra_threads=None, inter_threads=None, sdpa=True, compile=False):
+        self.bf16 = bf16
+        self.channels_last = channels_last
+        self.intra_threads = intra_threads
+        self.inter_threads = inter_threads
+        self.sdpa = sdpa
+        self.compile = compile
+
+    @classmethod
+    def recommended(cls):
+        """
+        Layout options that keep fp32 numerics. bf16 is only used when opted into, and thread
+        counts stay at the torch/ONNX Runtime defaults (physical cores) unless benchmarked or set.
+        """
+        return cls(bf16=False, channels_last=True, sdpa=True)
+
+    @classmethod
+    def default(cls):
+        """ The benchmarked profile saved for this machine, else the (fp32) recommended one """
+        return load_cpu_profile() or cls.recommended()
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{k: data.get(k) for k in ('bf16', 'channels_last', 'intra_threads', 'inter_threads', 'sdpa', 'compile')})
+
+    def to_dict(self):
+        return {'bf16': self.bf16, 'channels_last': self.channels_last, 'intra_threads': self.intra_threads,
+                'inter_threads': self.inter_threads, 'sdpa': self.sdpa, 'compile': self.compile}
+
+    @property
+    def name(self):
+        parts = [name for name in ('bf16', 'channels_last', 'sdpa', 'compile') if getattr(self, name)]
+        if self.intra_threads:
+            parts.append(f"threads={self.intra_threads}/{self.inter_threads or '-'}")
+        return '+'.join(parts) or 'fp32 baseline'
+
+    @property
+    def dtype(self):
+        return torch.bfloat16 if self.bf16 else torch.float32
+
+    def apply_threads(self, log_callback=print):
+        if self.intra_threads:
+            torch.set_num_threads(self.intra_threads)
+        if self.inter_threads:
+            try:
+                torch.set_num_interop_threads(self.inter_threads)
+            except RuntimeError:
+                # Can only be set once, before the first parallel op of the process
+                log_callback(f"Inter-op threads already fixed at {torch.get_num_interop_threads()}")
+
+    def apply(self, pipe, quantized=False, log_callback=print):
+        """
+        Converts a freshly loaded pipeline in place.
+        - quantized: The UNet/text encoder hold int8 layers; they stay float32 and are not compiled.
+        """
+        from diffusers.models.attention_processor import AttnProcessor, AttnProcessor2_0
+
+        self.apply_threads(log_callback)
+        if not quantized:
+            pipe.to(dtype=self.dtype)
+        for name in ('unet', 'vae'):
+            module = getattr(pipe, name, None)
+            if module is None:
+                continue
+            if self.channels_last and not (quantized and name == 'unet'):
+                module.to(memory_format=torch.channels_last)
+            module.set_attn_processor(AttnProcessor2_0() if self.sdpa else AttnProcessor())
+        if self.compile and not quantized:
+            pipe.unet = torch.compile(pipe.unet)
+        return pipe
+
+    def autocast(self):
+        return torch.autocast("cpu", dtype=torch.bfloat16, enabled=self.bf16)
+
+
+def benchmark_profiles(include_compile=False):
+    """ A baseline, each option on its own, then everything combined """
+    threads = os.cpu_count()
+    profiles = [
+        CPUInferenceProfile(sdpa=False),
+        CPUInferenceProfile(sdpa=True),
+        CPUInferenceProfile(channels_last=True, sdpa=False),
+        CPUInferenceProfile(intra_threads=threads, inter_threads=1, sdpa=False),
+    ]
+    if cpu_supports_bf16():
+        profiles.append(CPUInferenceProfile(bf16=True, sdpa=False))
+    profiles.append(CPUInferenceProfile.recommended())
+    if cpu_supports_bf16():
+        best = CPUInferenceProfile.recommended()
+        best.bf16 = True
+        profiles.append(best)
+    if include_compile:
+        best = CPUInferenceProfile.recommended()
+        best.compile = True
+        profiles.append(best)
+    return profiles
+
+def benchmark_cpu_profiles(engine, profiles=None, steps=BENCH_STEPS, size=BENCH_SIZE, save=False, log_callback=print):
+    """
+    Loads the edit pipeline once per profile and times `steps` denoising steps on a synthetic
+    size x size image (after one warm-up call, which also absorbs torch.compile).
+    Reports seconds per step and peak RSS; with save, the fastest profile becomes the default.
+    Peak RSS is process-wide, so later runs may include memory the allocator kept from earlier ones.
+    """
+    profiles = profiles or benchmark_profiles()
+    image = Image.effect_noise((size, size), 64).convert('RGB')
+    results = []
+
+    for profile in profiles:
+        engine.configure_cpu(profile)
+        rss_before = current_rss_bytes() or 0
+        with PeakRSSSampler() as rss:
+            start = time.perf_counter()
+            engine._load_edit_model()
+            load_seconds = time.perf_counter() - start
+
+            engine.edit_frame(image, BENCH_PROMPT, steps=1)
+            start = time.perf_counter()
+            engine.edit_frame(image, BENCH_PROMPT, steps=steps)
+            sec_per_step = (time.perf_counter() - start) / steps
+
+        result = {
+            'name': profile.name, 'profile': profile.to_dict(),
+            'sec_per_step': round(sec_per_step, 3), 'load_seconds': round(load_seconds, 1),
+            'peak_rss_gb': round(rss.peak / 1e9, 2), 'rss_growth_gb': round((rss.peak - rss_before) / 1e9, 2),
+        }
+        log_callback(f"CPU bench {profile.name}: {result['sec_per_step']} s/step, "
+                     f"peak RSS {result['peak_rss_gb']} GB (load {result['load_seconds']}s)")
+        results.append(result)
+        engine.unload('edit')
+
+    best = min(results, key=lambda r: r['sec_per_step'])
+    log_callback(f"Fastest CPU profile: {best['name']} ({best['sec_per_step']} s/step)")
+    if save:
+        save_cpu_profile(CPUInferenceProfile.from_dict(best['profile']), results)
+    engine.configure_cpu(CPUInferenceProfile.default())
+    return results
+
+
+# --- PROFILE LOOKUP ---
+def _profile_path():
+    return os.path.join(get_cache_dir(), PROFILE_FILE)
+
+def save_cpu_profile(profile, results=None):
+    data = {
+        'machine': platform.node(),
+        'torch': torch.__version__,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'profile': profile.to_dict(),
+        'results': results or [],
+    }
+    with open(_profile_path(), 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+def load_cpu_profile():
+    """ The saved profile, or None if missing / benchmarked with a different torch """
+    try:
+        with open(_profile_path(), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get('torch') != torch.__version__:
+        return None
+    return CPUInferenceProfile.from_dict(data['profile'])
@@ -0,0 +1,117 @@
+import time
+
+import torch
+from PIL import Image
+
+from .ai_options import BACKENDS, BENCH_PROMPT, BENCH_SIZE, BENCH_STEPS
+
+
+class EditBackend:
+    """
+    Inference engine behind AIImageEditor's edit path. Tensors crossing the interface are
+    float CPU torch tensors, so prompt/latent caches work the same with every backend.
+    Calls are serialized by AIImageEditor's lock.
+    """
+    name = None
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def load(self):
+        """ Makes the backend ready for encode/denoise calls (may download or export models) """
+        raise NotImplementedError
+
+    def unload(self):
+        """ Frees what the backend holds outside the engine's ModelManager """
+
+    def encode_text(self, text):
+        """ (1, tokens, hidden) CLIP embedding of one prompt """
+        raise NotImplementedError
+
+    def encode_images(self, input_images):
+        """ (B, 4, h, w) VAE image latents of prepared, same-size PIL images """
+        raise NotImplementedError
+
+    def denoise(self, image_latents, prompt_embeds, negative_embeds, steps, guidance_scale,
+                image_guidance_scale, step_callback=None, seed=None):
+        """ Runs the InstructPix2Pix sampler for a batch and returns the decoded PIL images """
+        raise NotImplementedError
+
+
+class TorchEditBackend(EditBackend):
+    """ The diffusers pipeline (CUDA or CPU, with the engine's CPU profile and quality tier) """
+    name = "torch"
+
+    def load(self):
+        self.engine.models.get('edit')
+
+    def encode_text(self, text):
+        pipe = self.engine.edit_pipe
+        tokens = pipe.tokenizer(
+            text, padding="max_length", max_length=pipe.tokenizer.model_max_length,
+            truncation=True, return_tensors="pt"
+        )
+        with torch.no_grad():
+            return pipe.text_encoder(tokens.input_ids.to(pipe._execution_device))[0].cpu()
+
+    def encode_images(self, input_images):
+        pipe = self.engine.edit_pipe
+        pixels = pipe.image_processor.preprocess(input_images)
+        with torch.no_grad():
+            return pipe.prepare_image_latents(
+                pixels, len(input_images), 1, pipe.vae.dtype, pipe._execution_device, False
+            ).cpu()
+
+    def denoise(self, image_latents, prompt_embeds, negative_embeds, steps, guidance_scale,
+                image_guidance_scale, step_callback=None, seed=None):
+        def pipe_callback(step, timestep, latents):
+            if step_callback: step_callback(step)
+
+        with self.engine._autocast():
+            return self.engine.edit_pipe(
+                prompt_embeds=prompt_embeds, negative_prompt_embeds=negative_embeds,
+                image=image_latents, num_inference_steps=steps,
+                guidance_scale=guidance_scale,
+                image_guidance_scale=image_guidance_scale,
+                generator=torch.manual_seed(seed) if seed is not None else None,
+                callback=pipe_callback, callback_steps=1
+            ).images
+
+
+def create_backend(name, engine):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}'. Use one of {BACKENDS}.")
+    if name == "onnx":
+        from .onnx_backend import OnnxEditBackend  # Needs onnxruntime, only when selected
+        return OnnxEditBackend(engine)
+    return TorchEditBackend(engine)
+
+
+def benchmark_backends(engine, backends=BACKENDS, steps=BENCH_STEPS, size=BENCH_SIZE, log_callback=print):
+    """
+    Times `steps` denoising steps per backend on a synthetic size x size image, after one
+    warm-up call that also absorbs any one-time export. Returns one result dict per backend.
+    """
+    image = Image.effect_noise((size, size), 64).convert('RGB')
+    previous = engine.backend.name
+    results = []
+    try:
+        for name in backends:
+            engine.configure_backend(name)
+            start = time.perf_counter()
+            engine.edit_frame(image, BENCH_PROMPT, steps=1, seed=0)
+            warm_up = time.perf_counter() - start
+
+            start = time.perf_counter()
+            engine.edit_frame(image, BENCH_PROMPT, steps=steps, seed=0)
+            sec_per_step = (time.perf_counter() - start) / steps
+            results.append({'backend': name, 'sec_per_step': round(sec_per_step, 3), 'warm_up_seconds': round(warm_up, 1)})
+            log_callback(f"Backend {name}: {sec_per_step:.3f} s/step (first call {warm_up:.1f}s)")
+    finally:
+        engine.configure_backend(previous)
+
+    baseline = next((r for r in results if r['backend'] == 'torch'), None)
+    if baseline:
+        for result in results:
+            result['speedup_vs_torch'] = round(baseline['sec_per_step'] / result['sec_per_step'], 2)
+    return results
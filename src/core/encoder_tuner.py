@@ -0,0 +1,163 @@
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+
+from .app_paths import get_cache_dir
+from .gpu_utils import get_available_encoders, _ffmpeg_fingerprint
+
+PROFILE_FILE = "encoder_profile.json"
+
+# Presets tried per encoder, fastest first (None = encoder has no preset option)
+ENCODER_PRESETS = {
+    'libx264': ['ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium'],
+    'h264_nvenc': ['p1', 'p3', 'p5', 'p7'],
+    'h264_qsv': ['veryfast', 'faster', 'medium', 'slow'],
+    'h264_amf': ['speed', 'balanced', 'quality'],
+    'h264_videotoolbox': [None],
+}
+
+TUNE_RESOLUTIONS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "2k": (2560, 1440),
+    "4k": (3840, 2160),
+}
+TUNE_SECONDS = 3
+TUNE_FPS = 30
+MIN_SSIM = 0.97
+
+def encoder_args(encoder, preset):
+    """ Speed preset + constant-quality settings for an encoder (everything after '-c:v <encoder>') """
+    if encoder == 'libx264':
+        return ['-preset', preset, '-crf', '20']
+    if encoder == 'h264_nvenc':
+        return ['-preset', preset, '-rc', 'vbr', '-cq', '21', '-b:v', '0']
+    if encoder == 'h264_qsv':
+        return ['-preset', preset, '-global_quality', '21']
+    if encoder == 'h264_amf':
+        return ['-quality', preset, '-rc', 'cqp', '-qp_i', '21', '-qp_p', '21']
+    if encoder == 'h264_videotoolbox':
+        return ['-q:v', '65']
+    return []
+
+def _measure_quality(encoded_path, reference_path):
+    """ Runs ffmpeg's SSIM and PSNR filters against the reference. Returns (ssim, psnr). """
+    result = subprocess.run([
+        'ffmpeg', '-i', encoded_path, '-i', reference_path,
+        '-lavfi', '[0:v]split[a][b];[1:v]split[c][d];[a][c]ssim;[b][d]psnr', '-f', 'null', '-'
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, encoding='utf-8', errors='replace')
+    ssim = re.search(r'SSIM .*All:([\d.]+)', result.stderr)
+    psnr = re.search(r'PSNR .*average:([\d.]+|inf)', result.stderr)
+    return (float(ssim.group(1)) if ssim else 0.0,
+            float(psnr.group(1)) if psnr else 0.0)
+
+
+def tune_encoders(resolutions=None, seconds=TUNE_SECONDS, min_ssim=MIN_SSIM, log_callback=print):
+    """
+    Benchmarks every available encoder/preset on a synthetic lavfi clip per resolution,
+    picks the fastest one that reaches min_ssim and saves the per-machine profile.
+    """
+    resolutions = resolutions or list(TUNE_RESOLUTIONS)
+    encoders = get_available_encoders()
+    frames = seconds * TUNE_FPS
+    results = []
+    chosen = {}
+
+    with tempfile.TemporaryDirectory(prefix="ec_tune_") as temp_dir:
+        for quality_preset in resolutions:
+            width, height = TUNE_RESOLUTIONS[quality_preset]
+            reference = os.path.join(temp_dir, f"ref_{quality_preset}.mkv")
+            subprocess.run([
+                'ffmpeg', '-y', '-v', 'error', '-f', 'lavfi',
+                # Temporal noise keeps the synthetic clip from being unrealistically easy to compress
+                '-i', f'testsrc2=size={width}x{height}:rate={TUNE_FPS}:duration={seconds},noise=alls=8:allf=t',
+                '-pix_fmt', 'yuv420p', '-c:v', 'ffv1', reference
+            ], check=True)
+
+            candidates = []
+            for encoder in encoders:
+                for preset in ENCODER_PRESETS.get(encoder, [None]):
+                    args = encoder_args(encoder, preset)
+                    encoded = os.path.join(temp_dir, f"{quality_preset}_{encoder}_{preset}.mp4")
+                    start = time.perf_counter()
+                    run = subprocess.run(
+                        ['ffmpeg', '-y', '-v', 'error', '-i', reference, '-c:v', encoder, *args,
+                         '-pix_fmt', 'yuv420p', encoded],
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                    )
+                    elapsed = time.perf_counter() - start
+                    if run.returncode != 0:
+                        log_callback(f"Tune {quality_preset}: {encoder} {preset} failed, skipping")
+                        continue
+
+                    ssim, psnr = _measure_quality(encoded, reference)
+                    result = {
+                        'quality_preset': quality_preset, 'encoder': encoder, 'preset': preset, 'args': args,
+                        'fps': round(frames / elapsed, 2), 'size': os.path.getsize(encoded),
+                        'ssim': round(ssim, 5), 'psnr': round(psnr, 2),
+                    }
+                    log_callback(f"Tune {quality_preset}: {encoder} {preset or ''} -> "
+                                 f"{result['fps']} fps, {result['size'] // 1024} KB, SSIM {ssim:.4f}, PSNR {psnr:.2f}")
+                    candidates.append(result)
+                    os.remove(encoded)
+
+            results.extend(candidates)
+            acceptable = [c for c in candidates if c['ssim'] >= min_ssim]
+            if acceptable:
+                chosen[quality_preset] = max(acceptable, key=lambda c: c['fps'])
+            elif candidates:
+                chosen[quality_preset] = max(candidates, key=lambda c: c['ssim'])
+            if quality_preset in chosen:
+                best = chosen[quality_preset]
+                log_callback(f"Tune {quality_preset}: picked {best['encoder']} {best['preset'] or ''}")
+
+    profile = {
+        'machine': platform.node(),
+        'ffmpeg': _ffmpeg_fingerprint(shutil.which('ffmpeg') or 'ffmpeg'),
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'min_ssim': min_ssim,
+        'presets': chosen,
+        'results': results,
+    }
+    with open(_profile_path(), 'w', encoding='utf-8') as f:
+        json.dump(profile, f, indent=2)
+    _profile_cache.clear()
+    return profile
+
+
+# --- PROFILE LOOKUP ---
+_profile_cache = {}
+
+def _profile_path():
+    return os.path.join(get_cache_dir(), PROFILE_FILE)
+
+def load_encoder_profile():
+    """ Returns the saved tuning profile, or None if missing / made with a different ffmpeg """
+    path = _profile_path()
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    if _profile_cache.get('mtime') != mtime:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                profile = json.load(f)
+            ffmpeg = shutil.which('ffmpeg')
+            if not ffmpeg or profile.get('ffmpeg') != _ffmpeg_fingerprint(ffmpeg):
+                profile = None
+        except (OSError, ValueError, subprocess.SubprocessError):
+            profile = None
+        _profile_cache.update(mtime=mtime, profile=profile)
+    return _profile_cache['profile']
+
+def tuned_codec_args(quality_preset):
+    """ ['-c:v', encoder, *settings] from the profile for this preset, or None if not tuned """
+    profile = load_encoder_profile()
+    entry = (profile or {}).get('presets', {}).get(quality_preset)
+    if not entry or entry['encoder'] not in get_available_encoders():
+        return None
+    return ['-c:v', entry['encoder'], *entry['args']]
@@ -0,0 +1,150 @@
+import subprocess
+import threading
+from collections import deque
+
+from PIL import Image
+
+from .media_info import probe_media
+
+# Only the tail of ffmpeg's stderr is kept for error reports
+STDERR_TAIL_LINES = 200
+
+class StderrTail:
+    """ Drains a process' stderr in a background thread, keeping only the last N lines """
+    def __init__(self, stream, max_lines=STDERR_TAIL_LINES):
+        self.lines = deque(maxlen=max_lines)
+        self._thread = threading.Thread(target=self._drain, args=(stream,), daemon=True)
+        self._thread.start()
+
+    def _drain(self, stream):
+        for line in stream:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', errors='replace')
+            self.lines.append(line.rstrip())
+        stream.close()
+
+    def text(self):
+        self._thread.join(timeout=5)
+        return "\n".join(self.lines)
+
+
+class FrameReader:
+    """
+    Decodes a video straight into memory through an ffmpeg rawvideo pipe (no temp PNGs).
+    Iterating yields RGB PIL images in presentation order.
+    - fps: Optional processing rate (decimation). By default CFR sources keep every native frame,
+      VFR sources are resampled by timestamp to their average rate so the writer's CFR timing stays in sync.
+    """
+    def __init__(self, video_path, fps=None):
+        self.video_path = video_path
+        self.media = probe_media(video_path)
+        if not self.media.has_video:
+            raise Exception(f"No video stream found in {video_path}")
+
+        # ffmpeg applies the rotation while decoding, so frames come out in display orientation
+        self.width, self.height = self.media.display_size
+        self.fps = fps or self.media.fps or 30
+        self.frame_count = max(1, round(self.media.duration * self.fps))
+        self.frame_size = self.width * self.height * 3
+
+        self.cmd = ['ffmpeg', '-v', 'error', '-i', video_path, '-map', '0:v:0']
+        if fps or self.media.is_vfr:
+            self.cmd.extend(['-vf', f'fps={self.fps}'])
+        else:
+            self.cmd.extend(['-fps_mode', 'passthrough'])
+        self.cmd.extend(['-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1'])
+
+    def __iter__(self):
+        process = subprocess.Popen(
+            self.cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            bufsize=self.frame_size
+        )
+        stderr_tail = StderrTail(process.stderr)
+        finished = False
+        try:
+            while True:
+                data = process.stdout.read(self.frame_size)
+                if len(data) < self.frame_size:
+                    finished = True
+                    break
+                yield Image.frombuffer('RGB', (self.width, self.height), data, 'raw', 'RGB', 0, 1)
+        finally:
+            if not finished:
+                process.kill()
+            process.stdout.close()
+            process.wait()
+        if process.returncode != 0:
+            raise Exception(f"FFmpeg Error: {stderr_tail.text()}")
+
+
+class FrameWriter:
+    """
+    Encodes in-memory frames through an ffmpeg rawvideo pipe and muxes the audio in the same pass.
+    The frame size is taken from the first frame written. Use as a context manager.
+    """
+    def __init__(self, output_path, fps, codec_args, audio_source=None, audio_args=None, video_filter=None):
+        self.output_path = output_path
+        self.video_filter = video_filter
+        self.fps = fps
+        self.codec_args = codec_args
+        self.audio_source = audio_source
+        self.audio_args = audio_args or ['-c:a', 'copy']
+        self.size = None
+        self.frames_written = 0
+        self._process = None
+        self._stderr_tail = None
+
+    def _open(self, size):
+        self.size = size
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{size[0]}x{size[1]}', '-r', str(self.fps), '-i', 'pipe:0'
+        ]
+        if self.audio_source:
+            cmd.extend(['-i', self.audio_source, '-map', '0:v', '-map', '1:a?', *self.audio_args])
+        filters = [self.video_filter] if self.video_filter else []
+        filters.append('scale=trunc(iw/2)*2:trunc(ih/2)*2')  # yuv420p needs even dimensions
+        cmd.extend([
+            *self.codec_args,
+            '-vf', ','.join(filters),
+            '-pix_fmt', 'yuv420p', self.output_path
+        ])
+        self._process = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        self._stderr_tail = StderrTail(self._process.stderr)
+
+    def write(self, image):
+        if self._process is None:
+            self._open(image.size)
+        if image.size != self.size:
+            image = image.resize(self.size, Image.Resampling.LANCZOS)
+        try:
+            self._process.stdin.write(image.convert('RGB').tobytes())
+        except BrokenPipeError:
+            self._process.wait()
+            raise Exception(f"FFmpeg Error: {self._stderr_tail.text()}")
+        self.frames_written += 1
+
+    def close(self):
+        if self._process is None:
+            raise Exception("No frames were written.")
+        self._process.stdin.close()
+        self._process.wait()
+        if self._process.returncode != 0:
+            raise Exception(f"FFmpeg Error: {self._stderr_tail.text()}")
+
+    def abort(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
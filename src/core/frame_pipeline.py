@@ -0,0 +1,194 @@
+import queue
+import threading
+import time
+
+QUEUE_SIZE = 8
+REPORT_EVERY_SECONDS = 10.0
+
+_DONE = object()
+
+class _Aborted(Exception):
+    """ Raised inside a stage when another stage failed """
+
+
+class _StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.waited = 0.0   # Seconds blocked on a queue (starved or back-pressured)
+        self.started = None
+        self.finished = None
+
+    def busy_seconds(self, now=None):
+        if self.started is None:
+            return 0.0
+        end = self.finished or now or time.perf_counter()
+        return max(end - self.started - self.waited, 1e-9)
+
+    def summary(self, now=None):
+        busy = self.busy_seconds(now)
+        return f"{self.name} {self.items} frames, {self.items / busy:.2f} fps busy, {self.waited:.1f}s waiting"
+
+
+class _QueueStats:
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.maxsize = maxsize
+        self.samples = 0
+        self.total = 0
+        self.peak = 0
+
+    def record(self, depth):
+        self.samples += 1
+        self.total += depth
+        self.peak = max(self.peak, depth)
+
+    def summary(self):
+        avg = self.total / self.samples if self.samples else 0.0
+        return f"{self.name} queue avg {avg:.1f}/{self.maxsize}, peak {self.peak}"
+
+
+class FramePipeline:
+    """
+    Runs decode -> inference -> encode concurrently, connected by bounded queues.
+    - source: Iterable of frames (consumed on a decoder thread).
+    - process: fn(frame_iterator) -> output iterator, run on the calling thread (the model lives there).
+    - sink: fn(output), called on an encoder thread.
+    Full queues block the upstream stage, so memory is capped at ~2 * queue_size frames.
+    """
+    def __init__(self, source, process, sink, queue_size=QUEUE_SIZE, log_callback=print,
+                 report_every=REPORT_EVERY_SECONDS):
+        self.source = source
+        self.process = process
+        self.sink = sink
+        self.log_callback = log_callback
+        self.report_every = report_every
+
+        self._in = queue.Queue(maxsize=queue_size)
+        self._out = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._errors = []
+        self.stats = {name: _StageStats(name) for name in ('decode', 'infer', 'encode')}
+        self.queue_stats = {'decode': _QueueStats('decode->infer', queue_size),
+                            'encode': _QueueStats('infer->encode', queue_size)}
+
+    # --- QUEUE HELPERS ---
+    def _put(self, q, item, stage, q_stats):
+        start = time.perf_counter()
+        while True:
+            if self._stop.is_set():
+                raise _Aborted()
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stage.waited += time.perf_counter() - start
+        q_stats.record(q.qsize())
+
+    def _get(self, q, stage, q_stats):
+        start = time.perf_counter()
+        q_stats.record(q.qsize())
+        while True:
+            if self._stop.is_set():
+                raise _Aborted()
+            try:
+                item = q.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        stage.waited += time.perf_counter() - start
+        return item
+
+    # --- STAGES ---
+    def _decode(self):
+        stats = self.stats['decode']
+        stats.started = time.perf_counter()
+        try:
+            for frame in self.source:
+                stats.items += 1
+                self._put(self._in, frame, stats, self.queue_stats['decode'])
+            self._put(self._in, _DONE, stats, self.queue_stats['decode'])
+        except _Aborted:
+            pass
+        except Exception as e:
+            self._fail(e)
+        finally:
+            stats.finished = time.perf_counter()
+
+    def _encode(self):
+        stats = self.stats['encode']
+        stats.started = time.perf_counter()
+        last_report = stats.started
+        try:
+            while True:
+                item = self._get(self._out, stats, self.queue_stats['encode'])
+                if item is _DONE:
+                    break
+                self.sink(item)
+                stats.items += 1
+                now = time.perf_counter()
+                if self.report_every and now - last_report >= self.report_every:
+                    last_report = now
+                    self._report(now)
+        except _Aborted:
+            pass
+        except Exception as e:
+            self._fail(e)
+        finally:
+            stats.finished = time.perf_counter()
+
+    def _inputs(self):
+        stats = self.stats['infer']
+        while True:
+            item = self._get(self._in, stats, self.queue_stats['decode'])
+            if item is _DONE:
+                return
+            yield item
+
+    def _fail(self, error):
+        self._errors.append(error)
+        self._stop.set()
+
+    # --- RUN ---
+    def run(self):
+        """ Runs all stages to completion. Re-raises the first stage error. """
+        started = time.perf_counter()
+        decoder = threading.Thread(target=self._decode, name="PipelineDecode", daemon=True)
+        encoder = threading.Thread(target=self._encode, name="PipelineEncode", daemon=True)
+        decoder.start()
+        encoder.start()
+
+        stats = self.stats['infer']
+        stats.started = time.perf_counter()
+        try:
+            for output in self.process(self._inputs()):
+                stats.items += 1
+                self._put(self._out, output, stats, self.queue_stats['encode'])
+            self._put(self._out, _DONE, stats, self.queue_stats['encode'])
+        except _Aborted:
+            pass
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            stats.finished = time.perf_counter()
+
+        encoder.join()
+        self._stop.set()  # Unblocks the decoder if inference stopped early
+        decoder.join()
+
+        elapsed = time.perf_counter() - started
+        self._report(summary=True, elapsed=elapsed)
+        if self._errors:
+            raise self._errors[0]
+        return elapsed
+
+    def _report(self, now=None, summary=False, elapsed=None):
+        stages = ' | '.join(s.summary(now) for s in self.stats.values())
+        queues = ', '.join(q.summary() for q in self.queue_stats.values())
+        if summary:
+            slowest = max(self.stats.values(), key=lambda s: s.busy_seconds())
+            self.log_callback(f"Pipeline done in {elapsed:.1f}s (slowest stage: {slowest.name}, "
+                              f"{slowest.busy_seconds():.1f}s busy): {stages}; {queues}")
+        else:
+            self.log_callback(f"Pipeline: {stages}; {queues}")
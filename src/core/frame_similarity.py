@@ -0,0 +1,121 @@
+from PIL import Image, ImageChops, ImageStat
+
+# Frames are compared as tiny grayscale thumbnails: cheap, and robust to noise/compression
+SIGNATURE_SIZE = (32, 32)
+
+# Near-duplicate: mean difference (0-255) below this reuses the previous edit.
+# Suggested value when skipping is turned on; it is off by default since reuse is lossy.
+DUPLICATE_THRESHOLD = 2.0
+
+# Shift search for warped reuse (slow pans): width of the thumbnail and max offset in its pixels
+WARP_WIDTH = 160
+WARP_MAX_SHIFT = 4
+
+def frame_signature(image):
+    """ Downsampled grayscale copy of a frame used for fast similarity checks """
+    return image.resize(SIGNATURE_SIZE, Image.Resampling.BOX).convert('L')
+
+def frame_distance(sig_a, sig_b):
+    """ Mean absolute difference between two signatures: 0 (identical) to 255 """
+    return ImageStat.Stat(ImageChops.difference(sig_a, sig_b)).mean[0]
+
+def _warp_thumbnail(image):
+    w, h = image.size
+    return image.resize((WARP_WIDTH, max(1, round(h * WARP_WIDTH / w))), Image.Resampling.BOX).convert('L')
+
+def estimate_shift(thumb_a, thumb_b, max_shift=WARP_MAX_SHIFT):
+    """
+    Finds the global translation (dx, dy) that best maps thumb_a onto thumb_b.
+    Returns (dx, dy, distance) with the distance measured over the overlapping area.
+    """
+    w, h = thumb_a.size
+    best = (0, 0, frame_distance(thumb_a, thumb_b))
+    for dy in range(-max_shift, max_shift + 1):
+        for dx in range(-max_shift, max_shift + 1):
+            if dx == 0 and dy == 0:
+                continue
+            a = thumb_a.crop((max(0, -dx), max(0, -dy), w - max(0, dx), h - max(0, dy)))
+            b = thumb_b.crop((max(0, dx), max(0, dy), w - max(0, -dx), h - max(0, -dy)))
+            dist = frame_distance(a, b)
+            if dist < best[2]:
+                best = (dx, dy, dist)
+    return best
+
+def shift_image(image, dx, dy):
+    """ Translates an image, keeping the old pixels in the uncovered strip instead of black """
+    shifted = image.copy()
+    shifted.paste(image, (dx, dy))
+    return shifted
+
+
+class DuplicateFrameSkipper:
+    """
+    Wraps a per-frame edit function and skips it for near-duplicate frames (static shots,
+    title cards, pauses) by reusing the last edited output.
+    Frames are compared with the last frame that was really edited, so slow drifts
+    eventually trigger a fresh edit instead of accumulating.
+    - threshold: Mean difference (0-255) under which a frame counts as a duplicate.
+    - warp: Also reuse the previous output, shifted, when the frame is a small global pan of it.
+    """
+    def __init__(self, edit_fn, threshold=DUPLICATE_THRESHOLD, warp=False, log_callback=print):
+        self.edit_fn = edit_fn
+        self.threshold = threshold
+        self.warp = warp
+        self.log_callback = log_callback
+
+        self.frames = 0
+        self.calls = 0
+        self.skipped = 0
+        self.warped = 0
+
+        self._last_sig = None     # Signature of the last frame that was really edited
+        self._last_thumb = None
+        self._last_out = None
+
+    def check(self, frame):
+        """
+        Returns None when the frame needs a real edit (it becomes the new reference),
+        otherwise the thumbnail shift to pass to reuse() with the reference's output.
+        """
+        self.frames += 1
+        sig = frame_signature(frame)
+
+        if self._last_sig is not None:
+            if frame_distance(sig, self._last_sig) < self.threshold:
+                self.skipped += 1
+                return (0, 0)
+
+            if self.warp:
+                dx, dy, dist = estimate_shift(self._last_thumb, _warp_thumbnail(frame))
+                if dist < self.threshold:
+                    self.skipped += 1
+                    self.warped += 1
+                    return (dx, dy)
+
+        self.calls += 1
+        self._last_sig = sig
+        self._last_thumb = _warp_thumbnail(frame) if self.warp else None
+        return None
+
+    def reuse(self, output, shift):
+        """ The reference's edited output, translated by a shift from check() """
+        dx, dy = shift
+        if not dx and not dy:
+            return output
+        scale = output.width / WARP_WIDTH
+        return shift_image(output, round(dx * scale), round(dy * scale))
+
+    def __call__(self, frame):
+        shift = self.check(frame)
+        if shift is None:
+            self._last_out = self.edit_fn(frame)
+            return self._last_out
+        return self.reuse(self._last_out, shift)
+
+    def report(self):
+        share = self.skipped / self.frames * 100 if self.frames else 0.0
+        warped = f" ({self.warped} warped)" if self.warp else ""
+        self.log_callback(
+            f"Duplicate frames: skipped {self.skipped}/{self.frames} inference calls{warped}, "
+            f"{share:.0f}% saved"
+        )
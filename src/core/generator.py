@@ -1,12 +1,59 @@
 import subprocess
 import os
+import json
+import math
 import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from .gpu_utils import get_best_encoder
+from .encoder_tuner import tuned_codec_args
+from .media_info import probe_media
+from .frame_pipe import FrameReader, FrameWriter, StderrTail
+
+# Still-image mode: one short low-fps segment is encoded, then repeated with stream copy
+STILL_FPS = 1
+STILL_SEGMENT_SECONDS = 60
+
+# Audio handling: 'auto' stream-copies when the output container accepts the source codec
+AUDIO_POLICIES = ("auto", "copy", "encode")
+AAC_AUDIO_ARGS = ['-c:a', 'aac', '-b:a', '192k']
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'alac', 'ac3', 'eac3'}
+CONTAINER_AUDIO_CODECS = {
+    '.mp4': MP4_AUDIO_CODECS,
+    '.m4v': MP4_AUDIO_CODECS,
+    '.mov': MP4_AUDIO_CODECS | {'pcm_s16le', 'pcm_s24le'},
+    '.mkv': None,  # Matroska takes anything
+}
+
+# Written by extract_frames next to the PNGs: frame rate and (for VFR sources) real timestamps
+FRAMES_INFO_FILE = "frames.json"
+
+# Containers that can hold the H.264 streams our encoders produce
+H264_CONTAINERS = {'.mp4', '.m4v', '.mov', '.mkv'}
+# Containers that cannot hold H.264/AAC at all (others without an entry above fall back to AAC)
+UNSUPPORTED_CONTAINERS = {'.webm', '.ogv'}
+# 8-bit 4:2:0 h264 profiles our encodes use too (High 10 / 4:2:2 / 4:4:4 sources get re-encoded)
+H264_COPY_PROFILES = {'Constrained Baseline', 'Baseline', 'Main', 'High'}
 
 class VideoGenerator:
-    def __init__(self):
-        self.encoder = get_best_encoder()
+    def __init__(self, log_callback=None):
+        self._encoder = None
+        self.log_callback = log_callback
+
+    def _log(self, message):
+        """ Prints and forwards to the optional log callback (e.g. the GUI console) """
+        print(message)
+        if self.log_callback:
+            self.log_callback(message)
+
+    @property
+    def encoder(self):
+        """ Shared probe result from the encoder registry (only waits if the startup probe is still running) """
+        if self._encoder is None:
+            self._encoder = get_best_encoder()
+        return self._encoder
 
     def _get_resolution(self, preset):
         resolutions = {
@@ -18,7 +65,16 @@ class VideoGenerator:
         return resolutions.get(preset, (1920, 1080))
 
     # --- VIDEO FUNCTIONS ---
-    def generate_video(self, image_path, audio_path, output_path, quality_preset="1080p"):
+    def generate_video(self, image_path, audio_path, output_path, quality_preset="1080p", progress_callback=None, still_mode=False, audio_policy="auto", ladder=None):
+        """
+        Renders a still image over an audio track.
+        - still_mode: Opt-in. Encode one short low-fps segment and loop it with stream copy, so the
+          encode cost doesn't grow with the audio length. The output is then 1 fps, which some
+          players/editors do not expect; the default is the classic '-loop 1' render at the preset's rate.
+        - audio_policy: 'auto' (copy if the container allows it), 'copy' or 'encode' (AAC 192k).
+        - ladder: Optional list of quality presets (e.g. ['720p', '1080p', '4k']). Every rendition is
+          rendered from one decode and saved as '<output>_<preset>.<ext>'. Returns {preset: path}.
+        """
         if not os.path.exists(image_path) or not os.path.exists(audio_path):
             raise FileNotFoundError("Input files not found.")
 
@@ -26,28 +82,197 @@ class VideoGenerator:
             width, height = img.size
             is_wide = width >= height
 
-        target_w, target_h = self._get_resolution(quality_preset)
-        if not is_wide:
-            target_w, target_h = target_h, target_w 
+        renditions = self._ladder_outputs(output_path, ladder) if ladder else [(quality_preset, output_path)]
+        targets = []
+        for preset, path in renditions:
+            target_w, target_h = self._get_resolution(preset)
+            if not is_wide:
+                target_w, target_h = target_h, target_w 
+            targets.append((path, (target_w, target_h), self._video_codec_args(preset)))
 
         duration = self.get_audio_duration(audio_path)
-        
-        cmd = [
-            'ffmpeg', '-y', '-loop', '1', '-i', image_path, '-i', audio_path,
-            '-c:v', self.encoder, '-t', str(duration), '-pix_fmt', 'yuv420p',
-            '-vf', f'scale={target_w}:{target_h}:force_original_aspect_ratio=decrease,pad={target_w}:{target_h}:(ow-iw)/2:(oh-ih)/2',
-            '-c:a', 'aac', '-b:a', '192k', '-shortest', output_path
-        ]
+        audio_args = self._audio_codec_args(audio_path, output_path, audio_policy)
+
+        with tempfile.TemporaryDirectory(prefix="ec_render_") as temp_dir:
+            if len(targets) > 1:
+                audio_path, audio_args = self._shared_audio_input(audio_path, audio_args, temp_dir)
+
+            if still_mode:
+                self._generate_still_video(image_path, audio_path, targets, duration, audio_args, temp_dir, progress_callback)
+            else:
+                graph, labels = self._split_filter('[0:v]', [self._scale_pad_filter(*size) for _, size, _ in targets])
+                cmd = [
+                    'ffmpeg', '-y', '-loop', '1', '-i', image_path, '-i', audio_path,
+                    '-filter_complex', graph
+                ]
+                for label, (path, _, codec_args) in zip(labels, targets):
+                    cmd.extend([
+                        '-map', label, '-map', '1:a', *codec_args, '-t', str(duration),
+                        '-pix_fmt', 'yuv420p', *audio_args, '-shortest', path
+                    ])
+                self._run_ffmpeg(cmd, self._percent_callback(duration, progress_callback))
+
+        return dict(renditions) if ladder else None
+
+    def _generate_still_video(self, image_path, audio_path, targets, duration, audio_args, temp_dir, progress_callback=None):
+        """ Constant-cost still-image render: scale/pad once, encode one segment, repeat it via the concat demuxer """
+        segment_seconds = min(STILL_SEGMENT_SECONDS, max(math.ceil(duration), 1))
+        repeats = max(math.ceil(duration / segment_seconds), 1)
+        gop = segment_seconds * STILL_FPS
+
+        # 1. Scale + pad the image once per rendition (same geometry as the scale/pad filter)
+        frame_paths = []
+        with Image.open(image_path) as img:
+            img = img.convert("RGB")
+            for i, (_, (target_w, target_h), _) in enumerate(targets):
+                ratio = min(target_w / img.width, target_h / img.height)
+                new_size = (max(1, round(img.width * ratio)), max(1, round(img.height * ratio)))
+                canvas = Image.new("RGB", (target_w, target_h), (0, 0, 0))
+                canvas.paste(img.resize(new_size, Image.Resampling.LANCZOS), ((target_w - new_size[0]) // 2, (target_h - new_size[1]) // 2))
+                frame_path = os.path.join(temp_dir, f"frame_{i}.png")
+                canvas.save(frame_path, compress_level=1)
+                frame_paths.append(frame_path)
+
+        # 2. Encode a short segment per rendition at a very low frame rate as a single GOP (one ffmpeg run)
+        cmd = ['ffmpeg', '-y']
+        for frame_path in frame_paths:
+            cmd.extend(['-loop', '1', '-framerate', str(STILL_FPS), '-t', str(segment_seconds), '-i', frame_path])
+        for i, (_, _, codec_args) in enumerate(targets):
+            cmd.extend([
+                '-map', f'{i}:v', '-r', str(STILL_FPS), *codec_args, '-g', str(gop),
+                '-pix_fmt', 'yuv420p', os.path.join(temp_dir, f"segment_{i}.mp4")
+            ])
         self._run_ffmpeg(cmd)
 
-    def upscale_video(self, input_video, output_path, quality_preset="1080p"):
+        # 3. Repeat each segment with stream copy to cover the audio
+        self._log(f"Still mode: {repeats} x {segment_seconds}s segment for {duration:.1f}s of audio")
+        for i, (path, _, _) in enumerate(targets):
+            list_path = os.path.join(temp_dir, f"segments_{i}.txt")
+            with open(list_path, 'w', encoding='utf-8') as f:
+                f.write(f"file 'segment_{i}.mp4'\n" * repeats)
+
+            cmd = [
+                'ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', list_path, '-i', audio_path,
+                '-map', '0:v', '-map', '1:a', '-c:v', 'copy',
+                *audio_args, '-t', str(duration), '-shortest', path
+            ]
+            self._run_ffmpeg(cmd, self._percent_callback(duration, self._part_progress(progress_callback, i, len(targets))))
+
+    def upscale_video(self, input_video, output_path, quality_preset="1080p", progress_callback=None, audio_policy="auto", parallel_segments=1, ladder=None):
+        """
+        Upscales (and letterboxes) a video to the preset resolution.
+        - parallel_segments: Split the input at keyframes and upscale that many segments at once.
+        - ladder: Optional list of quality presets rendered from a single decode as
+          '<output>_<preset>.<ext>' (takes precedence over parallel_segments). Returns {preset: path}.
+        """
         target_w, target_h = self._get_resolution(quality_preset)
+        media = probe_media(input_video)
+        if not media.has_video:
+            raise Exception(f"No video stream found in {input_video}")
+        duration = media.duration
+        video_filter = self._scale_pad_filter(target_w, target_h, flags='lanczos')
+        self._check_container(output_path)
+        audio_args = self._audio_codec_args(input_video, output_path, audio_policy) if media.has_audio else []
+
+        if ladder:
+            return self._upscale_ladder(media, output_path, ladder, audio_args, progress_callback)
+
+        if self._matches_target(media, output_path, target_w, target_h):
+            # Already at the target resolution/codec: just fix container and audio
+            if not media.has_audio:
+                self._log("Upscale: source already matches the preset, remuxing the video (stream copy, no audio)")
+            elif audio_args == ['-c:a', 'copy']:
+                self._log("Upscale: source already matches the preset, remuxing video and audio (stream copy)")
+            else:
+                self._log("Upscale: source video already matches the preset, copying video and re-encoding audio only")
+            cmd = ['ffmpeg', '-y', '-i', input_video, '-map', '0:v:0', '-map', '0:a?', '-c:v', 'copy', *audio_args, output_path]
+            self._run_ffmpeg(cmd, self._percent_callback(duration, progress_callback))
+            return
+        codec_args = self._video_codec_args(quality_preset)
+        self._log(f"Upscale: re-encoding {media.width}x{media.height} {media.video_codec} to {target_w}x{target_h} ({' '.join(codec_args[1:])})")
+
+        if parallel_segments > 1:
+            self._upscale_parallel(media, output_path, video_filter, codec_args, parallel_segments, audio_args, progress_callback)
+            return
+
         cmd = [
-            'ffmpeg', '-y', '-i', input_video, '-c:v', self.encoder,
-            '-vf', f'scale={target_w}:{target_h}:flags=lanczos:force_original_aspect_ratio=decrease,pad={target_w}:{target_h}:(ow-iw)/2:(oh-ih)/2',
-            '-c:a', 'copy', output_path
+            'ffmpeg', '-y', '-i', input_video, *codec_args,
+            '-vf', video_filter,
+            *audio_args, output_path
         ]
-        self._run_ffmpeg(cmd)
+        self._run_ffmpeg(cmd, self._percent_callback(duration, progress_callback))
+
+    def _upscale_parallel(self, media, output_path, video_filter, codec_args, segments, audio_args, progress_callback=None):
+        """ Segment-parallel upscale: split at keyframes, encode segments concurrently, concat with stream copy """
+        with tempfile.TemporaryDirectory(prefix="ec_upscale_") as temp_dir:
+            # 1. Split the video stream at keyframes (stream copy, the segment muxer cuts on keyframes)
+            segment_time = max(media.duration / segments, media.keyframe_interval or 1.0)
+            self._run_ffmpeg([
+                'ffmpeg', '-y', '-i', media.path, '-map', '0:v:0', '-c', 'copy',
+                '-f', 'segment', '-segment_time', f'{segment_time:.3f}', '-reset_timestamps', '1',
+                os.path.join(temp_dir, 'src_%04d.mkv')
+            ])
+            parts = sorted(f for f in os.listdir(temp_dir) if f.startswith('src_'))
+            self._log(f"Parallel upscale: {len(parts)} segments, {segments} workers")
+
+            # 2. Upscale the segments concurrently (each worker drives one ffmpeg process)
+            threads_per_job = max(1, (os.cpu_count() or 1) // segments)
+            done = {}
+            lock = threading.Lock()
+
+            def upscale_part(index, part):
+                out_path = os.path.join(temp_dir, f'up_{index:04d}.mp4')
+
+                def on_progress(seconds, fps, speed):
+                    with lock:
+                        done[index] = (seconds, fps, speed)
+                        encoded = sum(d[0] for d in done.values())
+                        total_fps = sum(d[1] for d in done.values())
+                        total_speed = sum(d[2] for d in done.values())
+                    if progress_callback:
+                        percent = int(min(encoded / media.duration, 1.0) * 100) if media.duration else 0
+                        progress_callback(percent, total_fps, total_speed)
+
+                self._run_ffmpeg([
+                    'ffmpeg', '-y', '-i', os.path.join(temp_dir, part), '-an',
+                    *codec_args, '-vf', video_filter, '-threads', str(threads_per_job), out_path
+                ], on_progress)
+                return out_path
+
+            with ThreadPoolExecutor(max_workers=segments) as pool:
+                outputs = list(pool.map(upscale_part, range(len(parts)), parts))
+
+            # 3. Stitch with the concat demuxer and take the audio from the source once
+            list_path = os.path.join(temp_dir, 'segments.txt')
+            with open(list_path, 'w', encoding='utf-8') as f:
+                f.writelines(f"file '{os.path.basename(p)}'\n" for p in outputs)
+            self._run_ffmpeg([
+                'ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', list_path, '-i', media.path,
+                '-map', '0:v', '-map', '1:a?', '-c:v', 'copy', *audio_args, output_path
+            ])
+
+    def _upscale_ladder(self, media, output_path, ladder, audio_args, progress_callback=None):
+        """ Renders every preset from one decode via a split filter graph, sharing one audio encode """
+        renditions = self._ladder_outputs(output_path, ladder)
+        filters = [self._scale_pad_filter(*self._get_resolution(preset), flags='lanczos') for preset, _ in renditions]
+        graph, labels = self._split_filter('[0:v]', filters)
+
+        with tempfile.TemporaryDirectory(prefix="ec_ladder_") as temp_dir:
+            cmd = ['ffmpeg', '-y', '-i', media.path]
+            audio_map = '0:a?'
+            if media.has_audio:
+                audio_source, audio_args = self._shared_audio_input(media.path, audio_args, temp_dir)
+                if audio_source != media.path:
+                    cmd.extend(['-i', audio_source])
+                    audio_map = '1:a'
+
+            cmd.extend(['-filter_complex', graph])
+            for label, (preset, path) in zip(labels, renditions):
+                cmd.extend(['-map', label, '-map', audio_map, *self._video_codec_args(preset), *audio_args, path])
+
+            self._log(f"Ladder: {', '.join(ladder)} from a single decode")
+            self._run_ffmpeg(cmd, self._percent_callback(media.duration, progress_callback))
+        return dict(renditions)
 
     # --- IMAGE FUNCTIONS ---
     def upscale_image_batch(self, image_paths, output_folder, quality_preset):
@@ -80,75 +305,285 @@ class VideoGenerator:
         new_img.save(output_path, quality=95)
 
     # --- AI VIDEO HELPERS ---
-    def extract_frames(self, video_path, output_folder):
-        """ Extracts all frames from a video into a folder """
+    def extract_frames(self, video_path, output_folder, process_fps=None):
+        """
+        Extracts the frames of a video into a folder, one PNG per source frame at the native rate.
+        - process_fps: Optional lower rate to deliberately decimate to (e.g. 12 for cheaper AI edits).
+        VFR sources keep their real timestamps in frames.json, which frames_to_video uses to restore timing.
+        """
         if os.path.exists(output_folder):
             shutil.rmtree(output_folder)
         os.makedirs(output_folder)
             
-        print(f"Extracting frames from {video_path}...")
+        media = probe_media(video_path)
+        if not media.has_video:
+            raise Exception(f"No video stream found in {video_path}")
+        print(f"Extracting frames from {video_path}... ({media})")
         
-        # Extract at 30fps
-        cmd = [
-            'ffmpeg', '-i', video_path, 
-            '-vf', 'fps=30', 
-            os.path.join(output_folder, 'frame_%04d.png')
-        ]
+        cmd = ['ffmpeg', '-i', video_path, '-map', '0:v:0']
+        if process_fps:
+            cmd.extend(['-vf', f'fps={process_fps}'])
+        else:
+            # One image per decoded frame: no duplicates or drops, whatever the frame rate
+            cmd.extend(['-fps_mode', 'passthrough'])
+        cmd.append(os.path.join(output_folder, 'frame_%04d.png'))
         self._run_ffmpeg(cmd)
         
         # Return sorted list of frames
-        return sorted([
+        frames = sorted([
             os.path.join(output_folder, f) 
             for f in os.listdir(output_folder) 
             if f.endswith('.png')
         ])
 
-    def frames_to_video(self, frames_folder, audio_source_video, output_path):
-        """ Stitches frames back into a video """
+        timestamps = None
+        if media.is_vfr and not process_fps:
+            timestamps = self._frame_timestamps(video_path)
+            if len(timestamps) != len(frames):
+                print(f"Timestamp count ({len(timestamps)}) doesn't match frames ({len(frames)}), using average fps")
+                timestamps = None
+        with open(os.path.join(output_folder, FRAMES_INFO_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'fps': process_fps or media.fps or 30, 'timestamps': timestamps}, f)
+        return frames
+
+    def frames_to_video(self, frames_folder, audio_source_video, output_path, progress_callback=None, audio_policy="auto", fps=None):
+        """
+        Stitches frames back into a video.
+        - fps: Frame rate override. Defaults to the rate recorded by extract_frames, then the source's rate.
+        """
         print(f"Stitching video to {output_path}...")
         
         has_audio = self.has_audio_stream(audio_source_video)
+        frame_names = sorted(f for f in os.listdir(frames_folder) if f.endswith('.png'))
+        frame_count = len(frame_names)
+
+        info = {}
+        info_path = os.path.join(frames_folder, FRAMES_INFO_FILE)
+        if os.path.exists(info_path):
+            with open(info_path, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+        timestamps = None if fps else info.get('timestamps')
+        fps = fps or info.get('fps') or probe_media(audio_source_video).fps or 30
         
         # Start command with input frames
-        cmd = [
-            'ffmpeg', '-y',
-            '-framerate', '30', 
-            '-i', os.path.join(frames_folder, 'frame_%04d.png'),
-        ]
+        if timestamps:
+            # VFR: replay the original per-frame durations through the concat demuxer
+            list_path = os.path.join(frames_folder, 'frames.ffconcat')
+            with open(list_path, 'w', encoding='utf-8') as f:
+                f.write("ffconcat version 1.0\n")
+                for i, name in enumerate(frame_names):
+                    duration = timestamps[i + 1] - timestamps[i] if i + 1 < len(timestamps) else 1 / fps
+                    f.write(f"file '{name}'\nduration {max(duration, 0.001):.6f}\n")
+                f.write(f"file '{frame_names[-1]}'\n")  # Last entry needs repeating for its duration to count
+            cmd = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', list_path]
+        else:
+            cmd = [
+                'ffmpeg', '-y',
+                '-framerate', str(fps), 
+                '-i', os.path.join(frames_folder, 'frame_%04d.png'),
+            ]
         
         # Add audio map if exists
         if has_audio:
-            cmd.extend(['-i', audio_source_video, '-map', '0:v', '-map', '1:a', '-c:a', 'copy'])
+            cmd.extend(['-i', audio_source_video, '-map', '0:v', '-map', '1:a'])
+            cmd.extend(self._audio_codec_args(audio_source_video, output_path, audio_policy))
             
+        if timestamps:
+            cmd.extend(['-fps_mode', 'vfr'])
         cmd.extend([
-            '-c:v', self.encoder, 
+            *self._video_codec_args(), 
             '-pix_fmt', 'yuv420p', 
             output_path
         ])
         
-        self._run_ffmpeg(cmd)
+        duration = timestamps[-1] - timestamps[0] + 1 / fps if timestamps else frame_count / fps
+        self._run_ffmpeg(cmd, self._percent_callback(duration, progress_callback))
+
+    def _frame_timestamps(self, video_path):
+        """ Presentation timestamps of every video frame (from packets, so nothing is decoded) """
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time',
+             '-of', 'csv=p=0', video_path],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='utf-8', errors='replace'
+        )
+        times = []
+        for line in result.stdout.splitlines():
+            try:
+                times.append(float(line.strip().strip(',')))
+            except ValueError:
+                continue
+        return sorted(times)
+
+    def read_frames(self, video_path, fps=None):
+        """ Streams decoded RGB frames from memory (ffmpeg rawvideo pipe, no temp folder) """
+        return FrameReader(video_path, fps)
+
+    def open_frame_writer(self, output_path, fps, audio_source=None, audio_policy="auto", video_filter=None):
+        """
+        Returns a FrameWriter that encodes in-memory frames and muxes audio_source's audio in the same pass.
+        - video_filter: Optional ffmpeg filter applied to the frames before encoding (e.g. minterpolate).
+        """
+        audio_args = None
+        if audio_source and self.has_audio_stream(audio_source):
+            audio_args = self._audio_codec_args(audio_source, output_path, audio_policy)
+        else:
+            audio_source = None
+        return FrameWriter(output_path, fps, self._video_codec_args(), audio_source, audio_args, video_filter)
+
+    def concat_video_chunks(self, chunk_paths, audio_source, output_path, audio_policy="auto", progress_callback=None):
+        """ Joins encoded chunks with stream copy and muxes audio_source's audio in the same pass """
+        with tempfile.TemporaryDirectory(prefix="ec_chunks_") as temp_dir:
+            list_path = os.path.join(temp_dir, 'chunks.txt')
+            with open(list_path, 'w', encoding='utf-8') as f:
+                f.writelines(f"file '{os.path.abspath(p)}'\n" for p in chunk_paths)
+            cmd = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', list_path]
+            if audio_source and self.has_audio_stream(audio_source):
+                cmd.extend(['-i', audio_source, '-map', '0:v', '-map', '1:a?', '-c:v', 'copy',
+                            *self._audio_codec_args(audio_source, output_path, audio_policy)])
+            else:
+                cmd.extend(['-c:v', 'copy'])
+            cmd.append(output_path)
+            self._run_ffmpeg(cmd, progress_callback)
 
     def has_audio_stream(self, video_path):
         try:
-            cmd = [
-                'ffprobe', '-v', 'error', 
-                '-select_streams', 'a', 
-                '-show_entries', 'stream=codec_name', 
-                '-of', 'default=noprint_wrappers=1:nokey=1', 
-                video_path
-            ]
-            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            return len(result.stdout.strip()) > 0
-        except:
+            return probe_media(video_path).has_audio
+        except Exception:
             return False
 
     # --- CORE HELPERS ---
-    def _run_ffmpeg(self, cmd):
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
-        stdout, stderr = process.communicate()
+    def _video_codec_args(self, quality_preset=None):
+        """ Encoder + speed/quality settings: from the tuned machine profile if there is one, else the best encoder """
+        if quality_preset:
+            tuned = tuned_codec_args(quality_preset)
+            if tuned:
+                return tuned
+        return ['-c:v', self.encoder]
+
+    def _matches_target(self, media, output_path, target_w, target_h):
+        """ True when the probed video stream can be copied as-is for this preset and container """
+        return (
+            (media.width, media.height) == (target_w, target_h)
+            and media.rotation == 0
+            and media.video_codec == 'h264'
+            and media.profile in H264_COPY_PROFILES
+            and media.pix_fmt == 'yuv420p'
+            and os.path.splitext(output_path)[1].lower() in H264_CONTAINERS
+        )
+
+    def _scale_pad_filter(self, width, height, flags=None):
+        """ Fit inside width x height keeping the aspect ratio, then letterbox """
+        scale_flags = f':flags={flags}' if flags else ''
+        return f'scale={width}:{height}{scale_flags}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2'
+
+    def _ladder_outputs(self, output_path, presets):
+        """ 'out.mp4' + ['720p', '4k'] -> [('720p', 'out_720p.mp4'), ('4k', 'out_4k.mp4')] """
+        base, ext = os.path.splitext(output_path)
+        return [(preset, f"{base}_{preset}{ext}") for preset in presets]
+
+    def _split_filter(self, source, filters):
+        """ One decode, many renditions: '[0:v]split=N[s0]..;[s0]<filter>[v0];..'. Returns (graph, output labels). """
+        if len(filters) == 1:
+            return f'{source}{filters[0]}[v0]', ['[v0]']
+        splits = ''.join(f'[s{i}]' for i in range(len(filters)))
+        chains = [f'[s{i}]{f}[v{i}]' for i, f in enumerate(filters)]
+        return ';'.join([f'{source}split={len(filters)}{splits}'] + chains), [f'[v{i}]' for i in range(len(filters))]
+
+    def _shared_audio_input(self, audio_source, audio_args, temp_dir):
+        """ Encodes the audio once (if it can't be copied) so every rendition can stream-copy it """
+        if audio_args == ['-c:a', 'copy']:
+            return audio_source, audio_args
+        shared_path = os.path.join(temp_dir, 'audio.m4a')
+        self._run_ffmpeg(['ffmpeg', '-y', '-i', audio_source, '-vn', *audio_args, shared_path])
+        return shared_path, ['-c:a', 'copy']
+
+    def _check_container(self, output_path):
+        """ Fails early for containers ffmpeg would refuse to mux H.264/AAC into at the very end """
+        ext = os.path.splitext(output_path)[1].lower()
+        if ext in UNSUPPORTED_CONTAINERS:
+            raise ValueError(f"Output container '{ext}' cannot hold H.264/AAC. "
+                             f"Use one of {', '.join(sorted(CONTAINER_AUDIO_CODECS))}.")
+
+    def _audio_codec_args(self, audio_source, output_path, audio_policy="auto"):
+        """
+        Returns the '-c:a ...' args: stream copy when allowed/requested, AAC otherwise
+        (also for containers without a known codec list). Empty when the source has no audio.
+        """
+        if audio_policy not in AUDIO_POLICIES:
+            raise ValueError(f"Unknown audio policy '{audio_policy}'. Use one of {AUDIO_POLICIES}.")
+        self._check_container(output_path)
+        if audio_policy == "encode":
+            return list(AAC_AUDIO_ARGS)
+        if audio_policy == "copy":
+            return ['-c:a', 'copy']
+
+        codec = probe_media(audio_source).audio_codec
+        if codec is None:
+            return []
+        allowed = CONTAINER_AUDIO_CODECS.get(os.path.splitext(output_path)[1].lower(), set())
+        if codec and (allowed is None or codec in allowed):
+            self._log(f"Audio: stream copy ({codec})")
+            return ['-c:a', 'copy']
+        self._log(f"Audio: re-encoding {codec} to AAC")
+        return list(AAC_AUDIO_ARGS)
+
+    def _run_ffmpeg(self, cmd, progress_callback=None):
+        """
+        Runs ffmpeg with machine-readable progress on stdout.
+        - progress_callback: Optional fn(encoded_seconds, fps, speed) called after every progress block.
+        stderr is drained in the background and only its tail is kept, so memory stays flat on long encodes.
+        """
+        cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + cmd[1:]
+        process = subprocess.Popen(
+            cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding='utf-8', errors='replace', bufsize=1
+        )
+        stderr_tail = StderrTail(process.stderr)
+
+        block = {}
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            if key != 'progress':
+                block[key] = value
+                continue
+            if progress_callback:
+                progress_callback(*self._parse_progress(block))
+            block = {}
+
+        process.wait()
         if process.returncode != 0:
-            raise Exception(f"FFmpeg Error: {stderr}")
+            raise Exception(f"FFmpeg Error: {stderr_tail.text()}")
+
+    def _parse_progress(self, block):
+        """ Turns one ffmpeg '-progress' block into (encoded_seconds, fps, speed) """
+        def to_float(value):
+            try:
+                return float(value.rstrip('x'))
+            except (AttributeError, ValueError):
+                return 0.0
+
+        # out_time_us is microseconds (out_time_ms is too, despite the name)
+        seconds = to_float(block.get('out_time_us', block.get('out_time_ms'))) / 1_000_000
+        return max(seconds, 0.0), to_float(block.get('fps')), to_float(block.get('speed'))
+
+    def _percent_callback(self, duration, progress_callback):
+        """ Adapts a fn(percent, fps, speed) callback to _run_ffmpeg's fn(seconds, fps, speed) """
+        if progress_callback is None:
+            return None
+
+        def on_progress(seconds, fps, speed):
+            percent = int(min(seconds / duration, 1.0) * 100) if duration else 0
+            progress_callback(percent, fps, speed)
+        return on_progress
+
+    def _part_progress(self, progress_callback, index, count):
+        """ Maps a step's 0-100% onto its share of a multi-step job """
+        if progress_callback is None:
+            return None
+
+        def on_progress(percent, fps, speed):
+            progress_callback(int((index * 100 + percent) / count), fps, speed)
+        return on_progress
 
     def get_audio_duration(self, audio_path):
-        result = subprocess.run(['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', audio_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, encoding='utf-8', errors='replace')
-        return float(result.stdout.strip())
\ No newline at end of file
+        return probe_media(audio_path).duration
\ No newline at end of file
@@ -1,32 +1,159 @@
+import json
+import os
+import shutil
 import subprocess
-import sys
+import threading
+
+from .app_paths import get_cache_dir
+
+# Common hardware encoders, in order of preference
+HARDWARE_ENCODERS = [
+    ('h264_nvenc', 'NVIDIA GPU'),        # Nvidia
+    ('h264_amf', 'AMD GPU'),             # AMD
+    ('h264_qsv', 'Intel QSV'),           # Intel
+    ('h264_videotoolbox', 'MacOS'),      # Mac
+]
+CPU_ENCODER = 'libx264'
+
+CACHE_FILE = "encoders.json"
+
+
+def _probe_encoder(ffmpeg, encoder):
+    """ Encodes one tiny frame to see if the encoder errors out immediately """
+    try:
+        subprocess.run(
+            [ffmpeg, '-v', 'error', '-f', 'lavfi', '-i', 'color=black:s=64x64',
+             '-c:v', encoder, '-frames:v', '1', '-f', 'null', '-'],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30
+        )
+        return True
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+        return False
+
+
+def _ffmpeg_fingerprint(ffmpeg):
+    """ Cache key for an ffmpeg binary: resolved path, version line and mtime """
+    real_path = os.path.realpath(ffmpeg)
+    result = subprocess.run(
+        [ffmpeg, '-version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        encoding='utf-8', errors='replace', timeout=30
+    )
+    version = result.stdout.splitlines()[0].strip() if result.stdout else "unknown"
+    return f"{real_path}|{version}|{int(os.path.getmtime(real_path))}"
+
+
+class EncoderRegistry:
+    """
+    Process-wide registry of working ffmpeg video encoders.
+    The probe runs once in a background thread and the result is cached on disk,
+    so every VideoGenerator shares it and later app starts skip probing entirely.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super(EncoderRegistry, cls).__new__(cls)
+                instance._encoders = [CPU_ENCODER]
+                instance._ready = threading.Event()
+                instance._thread = None
+                instance._thread_lock = threading.Lock()
+                cls._instance = instance
+        return cls._instance
+
+    def start(self, force=False):
+        """ Starts the background probe (no-op if it's already running or done) """
+        with self._thread_lock:
+            if force and self._ready.is_set():
+                self._ready.clear()
+                self._thread = None
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._probe, args=(force,), name="EncoderProbe", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """ Blocks until the probe finished. Returns False on timeout. """
+        self.start()
+        return self._ready.wait(timeout)
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def available_encoders(self):
+        """ All working encoders, best first. libx264 is always the last resort. """
+        self.wait()
+        return list(self._encoders)
+
+    def best_encoder(self):
+        return self.available_encoders()[0]
+
+    def _probe(self, force):
+        try:
+            self._encoders = self._load_or_probe(force)
+        except Exception as e:
+            print(f"Encoder probe failed, using CPU ({CPU_ENCODER}). Error: {e}")
+            self._encoders = [CPU_ENCODER]
+        finally:
+            self._ready.set()
+
+    def _load_or_probe(self, force):
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            return [CPU_ENCODER]
+
+        key = _ffmpeg_fingerprint(ffmpeg)
+        cache_path = os.path.join(get_cache_dir(), CACHE_FILE)
+        cache = {}
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                cache = {}
+
+        if not force and key in cache:
+            encoders = cache[key]['encoders']
+            print(f"Using cached encoder list: {', '.join(encoders)}")
+            return encoders
+
+        print("Checking for GPU acceleration...")
+        encoders = []
+        for encoder, name in HARDWARE_ENCODERS + [(CPU_ENCODER, 'CPU')]:
+            if _probe_encoder(ffmpeg, encoder):
+                print(f"Success: Found {name} encoder ({encoder}).")
+                encoders.append(encoder)
+        if not encoders:
+            print(f"No working encoder found. Falling back to {CPU_ENCODER}.")
+            encoders = [CPU_ENCODER]
+
+        cache[key] = {'encoders': encoders}
+        try:
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, indent=2)
+        except OSError as e:
+            print(f"Could not write encoder cache: {e}")
+        return encoders
+
+
+def start_encoder_probe(force=False):
+    """
+    Kicks off the background probe. Call this once at app startup.
+    - force: Probes again instead of using the cached list (after a driver or GPU change).
+    """
+    return EncoderRegistry().start(force)
+
+def get_available_encoders():
+    """ Returns every working ffmpeg video encoder, best first. """
+    return EncoderRegistry().available_encoders()
 
 def get_best_encoder():
     """
     Detects available hardware acceleration.
     Returns the ffmpeg video codec string (e.g., 'h264_nvenc', 'libx264').
     """
-    # Common hardware encoders
-    encoders = [
-        ('h264_nvenc', 'NVIDIA GPU'), # Nvidia
-        ('h264_amf', 'AMD GPU'),      # AMD
-        ('h264_qsv', 'Intel QSV'),    # Intel
-        ('videotoolbox', 'MacOS'),    # Mac
-    ]
-
-    print("Checking for GPU acceleration...")
-    for encoder, name in encoders:
-        try:
-            # We try to run ffmpeg with the encoder to see if it errors out immediately
-            subprocess.run(
-                ['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'color=black:s=64x64', 
-                 '-c:v', encoder, '-frames:v', '1', '-f', 'null', '-'],
-                check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-            )
-            print(f"Success: Found {name} acceleration ({encoder}).")
-            return encoder
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            continue
-
-    print("No GPU acceleration found. Falling back to CPU (libx264).")
-    return 'libx264'
\ No newline at end of file
+    return EncoderRegistry().best_encoder()
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from PIL import Image
+
+from .app_paths import get_cache_dir
+
+MANIFEST_FILE = "manifest.json"
+HASH_BLOCK = 1024 * 1024
+SAVE_EVERY_FRAMES = 25
+
+def file_hash(path):
+    """ Content hash of an input file (streamed, so multi-GB videos are fine) """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _write_json_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class EditJobStore:
+    """
+    Checkpoint folder for one AI video edit: a manifest (input hash, prompt, parameters)
+    plus the model output of every finished source frame, so a crashed job can be rerun
+    and continue where it stopped.
+    The job id is derived from the input content, the prompt and the parameters, so a rerun
+    with the same settings finds the same folder and anything else starts fresh.
+    Frames are written to a temp name and renamed, so a file that exists is always complete.
+    """
+    def __init__(self, input_path, prompt, params, root=None, log_callback=print):
+        self.log_callback = log_callback
+        input_hash = file_hash(input_path)
+        key = json.dumps({'input': input_hash, 'prompt': prompt, 'params': params}, sort_keys=True)
+        self.job_id = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+        self.path = os.path.join(root or get_cache_dir('ai_jobs'), self.job_id)
+        self.frames_dir = os.path.join(self.path, 'frames')
+        self.chunks_dir = os.path.join(self.path, 'chunks')
+        os.makedirs(self.frames_dir, exist_ok=True)
+        os.makedirs(self.chunks_dir, exist_ok=True)
+
+        self.manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        self.manifest = self._load_manifest() or {
+            'job_id': self.job_id,
+            'input': os.path.abspath(input_path),
+            'input_hash': input_hash,
+            'prompt': prompt,
+            'params': params,
+            'created': time.time(),
+            'status': 'running',
+            'frames_done': 0,
+            'chunks_done': {},
+        }
+        self._done = {int(name[:-4]) for name in os.listdir(self.frames_dir) if name.endswith('.png')}
+        self._unsaved = 0
+        self.resumed = len(self._done)
+
+        if self.resumed or self.manifest['chunks_done']:
+            self.log_callback(f"Resuming job {self.job_id}: {self.resumed} frames and "
+                              f"{len(self.manifest['chunks_done'])} chunks already done")
+        self.save()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self):
+        self.manifest['frames_done'] = len(self._done)
+        self.manifest['updated'] = time.time()
+        _write_json_atomic(self.manifest_path, self.manifest)
+        self._unsaved = 0
+
+    # --- FRAMES ---
+    def _frame_path(self, index):
+        return os.path.join(self.frames_dir, f'{index:06d}.png')
+
+    def has_frame(self, index):
+        return index in self._done
+
+    def load_frame(self, index):
+        with Image.open(self._frame_path(index)) as image:
+            return image.convert('RGB')
+
+    def save_frame(self, index, image):
+        path = self._frame_path(index)
+        tmp_path = path + '.tmp'
+        image.save(tmp_path, format='PNG', compress_level=1)
+        os.replace(tmp_path, path)
+        self._done.add(index)
+        self._unsaved += 1
+        if self._unsaved >= SAVE_EVERY_FRAMES:
+            self.save()
+
+    # --- CHUNKS ---
+    def chunk_path(self, number):
+        return os.path.join(self.chunks_dir, f'chunk_{number:05d}.mp4')
+
+    def is_chunk_done(self, number):
+        return str(number) in self.manifest['chunks_done']
+
+    def mark_chunk_done(self, number, frames):
+        self.manifest['chunks_done'][str(number)] = frames
+        self.save()
+
+    def finished_chunks(self):
+        return [self.chunk_path(n) for n in sorted(int(k) for k in self.manifest['chunks_done'])]
+
+    # --- LIFECYCLE ---
+    def finish(self, keep=False):
+        """ Marks the job complete and removes the checkpoint unless keep is set """
+        self.manifest['status'] = 'done'
+        self.save()
+        if not keep:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+class ChunkedFrameWriter:
+    """
+    Bulk mode: encodes output frames into fixed-size chunk files as they arrive, so finished
+    chunks are playable (and survive a crash) while the rest of the job is still running.
+    Chunks already recorded in the store are skipped on resume. Audio is muxed at join time.
+    """
+    def __init__(self, generator, store, fps, chunk_frames):
+        self.generator = generator
+        self.store = store
+        self.fps = fps
+        self.chunk_frames = chunk_frames
+        self.frames_written = 0
+        self._writer = None
+        self._chunk = None
+
+    def write(self, image):
+        number = self.frames_written // self.chunk_frames
+        self.frames_written += 1
+        if self.store.is_chunk_done(number):
+            return
+        if self._chunk != number:
+            self._close_chunk()
+            self._chunk = number
+            self._writer = self.generator.open_frame_writer(self._part_path(number), self.fps)
+        self._writer.write(image)
+        if self.frames_written % self.chunk_frames == 0:
+            self._close_chunk()
+
+    def _part_path(self, number):
+        return self.store.chunk_path(number)[:-4] + '.part.mp4'
+
+    def _close_chunk(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        os.replace(self._part_path(self._chunk), self.store.chunk_path(self._chunk))
+        self.store.mark_chunk_done(self._chunk, self._writer.frames_written)
+        self._writer = None
+        self._chunk = None
+
+    def close(self):
+        self._close_chunk()
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.abort()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
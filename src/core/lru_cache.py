@@ -0,0 +1,66 @@
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    Small thread-safe LRU map with hit/miss counters.
+    - max_entries: Entries kept before the least recently used one is evicted.
+    - max_bytes: Optional memory limit, measured with sizeof(value).
+    """
+    def __init__(self, name, max_entries=64, max_bytes=None, sizeof=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key][0]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # Would evict everything else and still not fit
+        with self._lock:
+            if key in self._data:
+                self.bytes -= self._data[key][1]
+            self._data[key] = (value, size)
+            self._data.move_to_end(key)
+            self.bytes += size
+            while len(self._data) > self.max_entries or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_create(self, key, factory):
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        memory = f", {self.bytes / 1e6:.0f}/{self.max_bytes / 1e6:.0f} MB" if self.max_bytes is not None else ""
+        return (f"{self.name} cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), "
+                f"{len(self._data)}/{self.max_entries} entries{memory}, {self.evictions} evictions")
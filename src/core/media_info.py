@@ -0,0 +1,123 @@
+import json
+import os
+import subprocess
+from functools import lru_cache
+
+# Seconds of packets read to estimate the keyframe interval (keeps the probe cheap on long files)
+KEYFRAME_SCAN_SECONDS = 10
+PROBE_CACHE_SIZE = 1024
+
+def _parse_rate(rate):
+    """ '30000/1001' -> 29.97. Returns 0.0 for missing or '0/0' rates. """
+    try:
+        num, _, den = str(rate).partition('/')
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+def _to_float(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class MediaInfo:
+    """ Everything the generator needs to know about a media file, read from a single ffprobe run """
+
+    def __init__(self, path, data):
+        self.path = path
+        self.format = data.get('format', {})
+        self.streams = data.get('streams', [])
+
+        video = [s for s in self.streams if s.get('codec_type') == 'video'
+                 and not s.get('disposition', {}).get('attached_pic')]
+        audio = [s for s in self.streams if s.get('codec_type') == 'audio']
+        self.video_stream = video[0] if video else None
+        self.audio_stream = audio[0] if audio else None
+
+        self.has_video = self.video_stream is not None
+        self.has_audio = self.audio_stream is not None
+        self.video_codec = self.video_stream.get('codec_name') if self.video_stream else None
+        self.audio_codec = self.audio_stream.get('codec_name') if self.audio_stream else None
+
+        self.duration = _to_float(self.format.get('duration'))
+        if not self.duration:
+            self.duration = max([_to_float(s.get('duration')) for s in self.streams] or [0.0])
+
+        self.width = self.height = 0
+        self.pix_fmt = None
+        self.profile = None
+        self.fps = 0.0
+        self.is_vfr = False
+        self.rotation = 0
+        if self.video_stream:
+            vs = self.video_stream
+            self.width = int(vs.get('width', 0))
+            self.height = int(vs.get('height', 0))
+            self.pix_fmt = vs.get('pix_fmt')
+            self.profile = vs.get('profile')
+            avg_fps = _parse_rate(vs.get('avg_frame_rate'))
+            real_fps = _parse_rate(vs.get('r_frame_rate'))
+            self.fps = avg_fps or real_fps
+            # r_frame_rate is the lowest rate that represents every timestamp, avg is frames/duration
+            self.is_vfr = bool(avg_fps and real_fps and abs(avg_fps - real_fps) > 0.01)
+            self.rotation = self._read_rotation(vs)
+
+        self.keyframe_interval = self._read_keyframe_interval(data.get('packets', []))
+
+    @property
+    def display_size(self):
+        """ (width, height) as the video is shown, i.e. after applying rotation """
+        if self.rotation % 180 == 90:
+            return self.height, self.width
+        return self.width, self.height
+
+    def _read_rotation(self, stream):
+        rotation = stream.get('tags', {}).get('rotate')
+        for side_data in stream.get('side_data_list', []):
+            if 'rotation' in side_data:
+                rotation = side_data['rotation']
+        return int(_to_float(rotation)) % 360
+
+    def _read_keyframe_interval(self, packets):
+        """ Average seconds between keyframes in the scanned window, None if unknown """
+        if not self.video_stream:
+            return None
+        index = self.video_stream.get('index')
+        times = sorted(
+            _to_float(p.get('pts_time'))
+            for p in packets
+            if p.get('stream_index') == index and 'K' in p.get('flags', '') and p.get('pts_time') is not None
+        )
+        if len(times) < 2:
+            return None
+        return (times[-1] - times[0]) / (len(times) - 1)
+
+    def __repr__(self):
+        return (f"MediaInfo({os.path.basename(self.path)}: {self.duration:.2f}s, "
+                f"video={self.video_codec} {self.width}x{self.height}@{self.fps:.3f}, audio={self.audio_codec})")
+
+
+@lru_cache(maxsize=PROBE_CACHE_SIZE)
+def _probe_cached(path, size, mtime_ns):
+    cmd = [
+        'ffprobe', '-v', 'error', '-print_format', 'json',
+        '-show_format', '-show_streams',
+        '-show_entries', 'packet=stream_index,pts_time,flags',
+        '-read_intervals', f'%+{KEYFRAME_SCAN_SECONDS}',
+        path
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='utf-8', errors='replace')
+    if result.returncode != 0:
+        raise Exception(f"FFprobe Error: {result.stderr.strip()}")
+    return MediaInfo(path, json.loads(result.stdout or '{}'))
+
+def probe_media(path):
+    """
+    Returns the MediaInfo for a file.
+    Results are memoized by (path, size, mtime), so a file is only probed again after it changes.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return _probe_cached(path, stat.st_size, stat.st_mtime_ns)
@@ -0,0 +1,105 @@
+import gc
+import threading
+from collections import OrderedDict
+
+from .memory_utils import total_ram_bytes
+
+# Default budget: this share of physical RAM may be held by loaded pipelines
+DEFAULT_BUDGET_FRACTION = 0.6
+
+def module_bytes(model):
+    """ Parameter + buffer bytes of a torch module, or of every module component of a diffusers pipeline """
+    modules = [model] if hasattr(model, 'parameters') else [
+        c for c in getattr(model, 'components', {}).values() if hasattr(c, 'parameters')
+    ]
+    total = 0
+    for module in modules:
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class ModelManager:
+    """
+    Loads pipelines on demand and keeps them under a RAM budget.
+    Each model is registered with a loader and a size estimate; before a load, least recently
+    used models are unloaded until the estimate fits. unload() frees models explicitly.
+    - budget_bytes: RAM the loaded models may use (default: 60% of physical RAM).
+    """
+    def __init__(self, budget_bytes=None, log_callback=print):
+        total = total_ram_bytes()
+        self.budget_bytes = budget_bytes or (int(total * DEFAULT_BUDGET_FRACTION) if total else None)
+        self.log_callback = log_callback
+        self._specs = {}
+        self._loaded = OrderedDict()   # name -> (model, measured bytes), least recently used first
+        self._lock = threading.RLock()
+
+    def register(self, name, loader, estimate_bytes, sizeof=None):
+        """
+        loader() returns the model; estimate_bytes is its expected size before it is loaded.
+        - sizeof: fn(model) -> bytes for models that are not torch modules (default: module_bytes).
+        """
+        self._specs[name] = (loader, estimate_bytes, sizeof or module_bytes)
+
+    def is_registered(self, name):
+        return name in self._specs
+
+    def get(self, name):
+        """ Returns the model, loading it (and evicting others to make room) if needed """
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name][0]
+
+            loader, estimate, sizeof = self._specs[name]
+            self._make_room(estimate)
+            model = loader()
+            size = sizeof(model)
+            self._loaded[name] = (model, size)
+            self.log_callback(f"Model '{name}' loaded ({size / 1e9:.1f} GB). {self.summary()}")
+            return model
+
+    def set_budget(self, budget_bytes):
+        """ Changes the budget and unloads models right away if they no longer fit """
+        with self._lock:
+            self.budget_bytes = budget_bytes
+            self._make_room(0)
+
+    def is_loaded(self, name):
+        return name in self._loaded
+
+    def used_bytes(self):
+        return sum(size for _, size in self._loaded.values())
+
+    def _make_room(self, needed):
+        if self.budget_bytes is None:
+            return
+        while self._loaded and self.used_bytes() + needed > self.budget_bytes:
+            victim = next(iter(self._loaded))
+            self.log_callback(f"Memory budget: unloading '{victim}' to make room")
+            self.unload(victim)
+        if self.used_bytes() + needed > self.budget_bytes:
+            self.log_callback(f"Warning: model needs ~{needed / 1e9:.1f} GB, over the "
+                              f"{self.budget_bytes / 1e9:.1f} GB budget")
+
+    def unload(self, name=None):
+        """ Frees one model, or all of them when name is None """
+        with self._lock:
+            names = [name] if name else list(self._loaded)
+            for n in names:
+                model, _ = self._loaded.pop(n, (None, 0))
+                if hasattr(model, 'remove_all_hooks'):
+                    model.remove_all_hooks()  # Drops accelerate's CPU-offload references
+            model = None
+            gc.collect()
+            try:
+                import torch
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+            except ImportError:
+                pass
+
+    def summary(self):
+        budget = f"{self.budget_bytes / 1e9:.1f} GB" if self.budget_bytes else "unlimited"
+        names = ', '.join(self._loaded) or 'none'
+        return f"Models in memory: {names} ({self.used_bytes() / 1e9:.1f} GB of {budget})"
@@ -0,0 +1,276 @@
+import gc
+import os
+import shutil
+import time
+
+import numpy as np
+import torch
+
+from .ai_editor import EDIT_MODEL_ID
+from .app_paths import get_cache_dir
+from .edit_backends import EditBackend
+from .quantization import model_revision
+
+ONNX_OPSET = 17
+RESOLUTION_GRAPHS = ("unet", "vae_encoder", "vae_decoder")
+# Budget estimates before a session is loaded (measured from the graph files afterwards)
+TEXT_ENCODER_BYTES = 0.5e9
+RESOLUTION_BYTES = 3.8e9  # fp32 UNet (~3.4 GB) + VAE encoder/decoder
+# Resolutions whose UNet/VAE exports stay on disk (several GB each); least recently used go first
+MAX_EXPORTED_RESOLUTIONS = 4
+
+def _folder_bytes(folder):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(folder) for f in files)
+
+
+class _TextEncoder(torch.nn.Module):
+    def __init__(self, text_encoder):
+        super().__init__()
+        self.text_encoder = text_encoder
+
+    def forward(self, input_ids):
+        return self.text_encoder(input_ids)[0]
+
+class _VaeEncoder(torch.nn.Module):
+    def __init__(self, vae):
+        super().__init__()
+        self.vae = vae
+
+    def forward(self, pixels):
+        # Pix2pix conditions on the unscaled distribution mode, not a sample
+        return self.vae.encode(pixels).latent_dist.mode()
+
+class _VaeDecoder(torch.nn.Module):
+    def __init__(self, vae):
+        super().__init__()
+        self.vae = vae
+
+    def forward(self, latents):
+        return self.vae.decode(latents).sample
+
+class _UNet(torch.nn.Module):
+    def __init__(self, unet):
+        super().__init__()
+        self.unet = unet
+
+    def forward(self, sample, timestep, encoder_hidden_states):
+        return self.unet(sample, timestep, encoder_hidden_states, return_dict=False)[0]
+
+
+class OnnxEditBackend(EditBackend):
+    """
+    Runs the edit model with ONNX Runtime on the CPU execution provider.
+    The text encoder, VAE and UNet are exported once from the float32 diffusers weights and
+    cached per model revision (and per resolution for the UNet/VAE, whose spatial size is fixed
+    in the graph); the InstructPix2Pix sampling loop runs here with the diffusers scheduler.
+    Sessions are registered with the engine's ModelManager ('onnx-text', 'onnx-<w>x<h>'), so they
+    count against its memory budget and are evicted like the torch pipelines.
+    """
+    name = "onnx"
+
+    def __init__(self, engine, model_id=EDIT_MODEL_ID, log_callback=print):
+        super().__init__(engine)
+        self.log_callback = log_callback
+        self.model_id = model_id
+        self.tokenizer = None
+        self.scheduler_config = None
+        self.image_processor = None
+        self.vae_scaling = None
+        self.model_names = set()
+
+    def _runtime(self):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("The ONNX backend needs onnxruntime and onnx: pip install onnxruntime onnx")
+        return onnxruntime
+
+    def _session(self, path):
+        ort = self._runtime()
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        profile = self.engine.cpu_profile
+        if profile and profile.intra_threads:
+            options.intra_op_num_threads = profile.intra_threads
+        return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def _export_root(self):
+        revision = model_revision(self.model_id, "scheduler/scheduler_config.json") or 'local'
+        return get_cache_dir('onnx', f"{self.model_id.replace('/', '--')}-{revision}")
+
+    def _graph_path(self, graph, resolution=None):
+        folder = f"{resolution[0]}x{resolution[1]}" if resolution else ""
+        return os.path.join(self._export_root(), folder, graph, "model.onnx")
+
+    def _managed(self, name, loader, estimate, folder):
+        """ Loads (or reuses) a session set through the ModelManager, sized by its graph files """
+        models = self.engine.models
+        if not models.is_registered(name):
+            models.register(name, loader, estimate, sizeof=lambda _: _folder_bytes(folder))
+        self.model_names.add(name)
+        return models.get(name)
+
+    def _text_session(self):
+        path = self._graph_path("text_encoder")
+
+        def create():
+            if not os.path.exists(path):
+                self._export()
+            return self._session(path)
+        return self._managed("onnx-text", create, TEXT_ENCODER_BYTES, os.path.dirname(path))
+
+    def load(self):
+        if self.tokenizer is not None:
+            self._text_session()
+            return
+        self._runtime()
+        from diffusers import AutoencoderKL, EulerAncestralDiscreteScheduler
+        from diffusers.image_processor import VaeImageProcessor
+        from transformers import CLIPTokenizer
+
+        self.tokenizer = CLIPTokenizer.from_pretrained(self.model_id, subfolder="tokenizer")
+        self.scheduler_config = EulerAncestralDiscreteScheduler.load_config(self.model_id, subfolder="scheduler")
+        vae_config = AutoencoderKL.load_config(self.model_id, subfolder="vae")
+        self.vae_scaling = vae_config.get('scaling_factor', 0.18215)
+        self.image_processor = VaeImageProcessor(vae_scale_factor=2 ** (len(vae_config['block_out_channels']) - 1))
+
+        self._text_session()
+
+    def unload(self):
+        for name in self.model_names:
+            self.engine.models.unload(name)
+
+    def _resolution_graphs(self, width, height):
+        folder = os.path.join(self._export_root(), f"{width}x{height}")
+
+        def create():
+            paths = {graph: self._graph_path(graph, (width, height)) for graph in RESOLUTION_GRAPHS}
+            if not all(os.path.exists(p) for p in paths.values()):
+                self._prune_exports()
+                self._export((width, height))
+            os.utime(folder)  # Marks it recently used for _prune_exports
+            return {graph: self._session(p) for graph, p in paths.items()}
+        return self._managed(f"onnx-{width}x{height}", create, RESOLUTION_BYTES, folder)
+
+    def _prune_exports(self):
+        """ Deletes the least recently used resolution exports to stay under MAX_EXPORTED_RESOLUTIONS """
+        root = self._export_root()
+        exported = [name for name in os.listdir(root) if name.count('x') == 1 and name.replace('x', '').isdigit()]
+        removable = sorted(
+            (name for name in exported if not self.engine.models.is_loaded(f"onnx-{name}")),
+            key=lambda name: os.path.getmtime(os.path.join(root, name))
+        )
+        while removable and len(exported) >= MAX_EXPORTED_RESOLUTIONS:
+            name = removable.pop(0)
+            exported.remove(name)
+            self.log_callback(f"Removing the ONNX export for {name} (keeping at most {MAX_EXPORTED_RESOLUTIONS} resolutions)")
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+    # --- EXPORT ---
+    def _export(self, resolution=None):
+        """ Exports the text encoder, or the UNet + VAE graphs for a (width, height) resolution """
+        from diffusers import StableDiffusionInstructPix2PixPipeline
+
+        start = time.perf_counter()
+        what = f"UNet/VAE at {resolution[0]}x{resolution[1]}" if resolution else "text encoder"
+        self.log_callback(f"Exporting the edit model's {what} to ONNX (one-time, may take a few minutes)...")
+        pipe = StableDiffusionInstructPix2PixPipeline.from_pretrained(
+            self.model_id, torch_dtype=torch.float32, safety_checker=None
+        )
+        tokens = self.tokenizer.model_max_length
+        hidden = pipe.text_encoder.config.hidden_size
+        batch = {0: "batch"}
+
+        with torch.no_grad():
+            if resolution is None:
+                self._export_graph(
+                    _TextEncoder(pipe.text_encoder), (torch.zeros((1, tokens), dtype=torch.int64),),
+                    self._graph_path("text_encoder"), ["input_ids"], ["last_hidden_state"],
+                    {"input_ids": batch, "last_hidden_state": batch}
+                )
+            else:
+                width, height = resolution
+                latent = (height // self.image_processor.config.vae_scale_factor,
+                          width // self.image_processor.config.vae_scale_factor)
+                self._export_graph(
+                    _UNet(pipe.unet),
+                    (torch.randn(3, pipe.unet.config.in_channels, *latent), torch.tensor([999.0]), torch.randn(3, tokens, hidden)),
+                    self._graph_path("unet", resolution), ["sample", "timestep", "encoder_hidden_states"], ["noise_pred"],
+                    {"sample": batch, "encoder_hidden_states": batch, "noise_pred": batch}
+                )
+                self._export_graph(
+                    _VaeEncoder(pipe.vae), (torch.randn(1, 3, height, width),),
+                    self._graph_path("vae_encoder", resolution), ["pixels"], ["latents"],
+                    {"pixels": batch, "latents": batch}
+                )
+                self._export_graph(
+                    _VaeDecoder(pipe.vae), (torch.randn(1, pipe.vae.config.latent_channels, *latent),),
+                    self._graph_path("vae_decoder", resolution), ["latents"], ["image"],
+                    {"latents": batch, "image": batch}
+                )
+        del pipe
+        gc.collect()
+        self.log_callback(f"ONNX export of the {what} done in {time.perf_counter() - start:.0f}s")
+
+    def _export_graph(self, module, inputs, path, input_names, output_names, dynamic_axes):
+        # Exported into a temporary folder and renamed, so an interrupted export never looks complete.
+        # Graphs over 2 GB (the UNet) put their weights in external data files next to model.onnx.
+        folder = os.path.dirname(path)
+        staging = folder + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        torch.onnx.export(
+            module.eval(), inputs, os.path.join(staging, os.path.basename(path)),
+            input_names=input_names, output_names=output_names,
+            dynamic_axes=dynamic_axes, opset_version=ONNX_OPSET, do_constant_folding=True
+        )
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(staging, folder)
+
+    # --- INFERENCE ---
+    def encode_text(self, text):
+        tokens = self.tokenizer(
+            text, padding="max_length", max_length=self.tokenizer.model_max_length,
+            truncation=True, return_tensors="np"
+        )
+        hidden = self._text_session().run(None, {"input_ids": tokens.input_ids.astype(np.int64)})[0]
+        return torch.from_numpy(hidden)
+
+    def encode_images(self, input_images):
+        pixels = self.image_processor.preprocess(input_images).float()
+        graphs = self._resolution_graphs(pixels.shape[-1], pixels.shape[-2])
+        return torch.from_numpy(graphs["vae_encoder"].run(None, {"pixels": pixels.numpy()})[0])
+
+    def denoise(self, image_latents, prompt_embeds, negative_embeds, steps, guidance_scale,
+                image_guidance_scale, step_callback=None, seed=None):
+        """ Same sampling as StableDiffusionInstructPix2PixPipeline (text, image, unconditional branches) """
+        from diffusers import EulerAncestralDiscreteScheduler
+
+        scale = self.image_processor.config.vae_scale_factor
+        height, width = image_latents.shape[-2:]
+        graphs = self._resolution_graphs(width * scale, height * scale)
+
+        scheduler = EulerAncestralDiscreteScheduler.from_config(self.scheduler_config)
+        scheduler.set_timesteps(steps)
+        generator = torch.manual_seed(seed) if seed is not None else None
+        image_latents = image_latents.float()
+        latents = torch.randn(image_latents.shape, generator=generator) * scheduler.init_noise_sigma
+
+        embeds = torch.cat([prompt_embeds, negative_embeds, negative_embeds]).float().numpy()
+        condition = torch.cat([image_latents, image_latents, torch.zeros_like(image_latents)])
+
+        for i, t in enumerate(scheduler.timesteps):
+            model_input = scheduler.scale_model_input(torch.cat([latents] * 3), t)
+            model_input = torch.cat([model_input, condition], dim=1)
+            noise = graphs["unet"].run(None, {
+                "sample": model_input.numpy(),
+                "timestep": np.array([float(t)], dtype=np.float32),
+                "encoder_hidden_states": embeds,
+            })[0]
+            text, image, uncond = torch.from_numpy(noise).chunk(3)
+            noise = uncond + guidance_scale * (text - image) + image_guidance_scale * (image - uncond)
+            latents = scheduler.step(noise, t, latents, generator=generator).prev_sample
+            if step_callback: step_callback(i)
+
+        decoded = graphs["vae_decoder"].run(None, {"latents": (latents / self.vae_scaling).numpy()})[0]
+        return self.image_processor.postprocess(torch.from_numpy(decoded), output_type="pil")
@@ -0,0 +1,89 @@
+import hashlib
+import math
+import os
+import time
+
+import torch
+from PIL import Image, ImageChops, ImageStat
+
+from .ai_options import DRIFT_PROMPT, DRIFT_SEED, DRIFT_STEPS, QUALITY_TIERS
+from .app_paths import get_cache_dir
+
+QUANTIZED_MODULES = ("unet", "text_encoder")
+
+def quantize_module(module):
+    """ Dynamic int8 quantization of every nn.Linear (weights int8, activations quantized per batch) """
+    return torch.ao.quantization.quantize_dynamic(module.float(), {torch.nn.Linear}, dtype=torch.qint8)
+
+def model_revision(model_id, filename="model_index.json"):
+    """ Hub commit hash of the locally cached snapshot (no network), or None if filename is not downloaded yet """
+    from huggingface_hub import try_to_load_from_cache
+    path = try_to_load_from_cache(model_id, filename)
+    return os.path.basename(os.path.dirname(path)) if isinstance(path, str) else None
+
+def quantized_cache_dir(model_id, revision):
+    slug = model_id.replace('/', '--')
+    key = hashlib.sha256(f"{revision}|{torch.__version__}".encode('utf-8')).hexdigest()[:12]
+    return get_cache_dir('quantized', f"{slug}-{key}")
+
+def load_quantized_modules(model_id):
+    """ Previously quantized modules for the cached model revision / torch version, or None """
+    revision = model_revision(model_id)
+    if revision is None:
+        return None
+    folder = quantized_cache_dir(model_id, revision)
+    paths = {name: os.path.join(folder, f"{name}.pt") for name in QUANTIZED_MODULES}
+    if not all(os.path.exists(p) for p in paths.values()):
+        return None
+    # Whole pickled modules: quantized layers cannot go through from_pretrained
+    return {name: torch.load(p, weights_only=False) for name, p in paths.items()}
+
+def quantize_pipeline(pipe, model_id, log_callback=print):
+    """ Quantizes the UNet and text encoder in place and caches them on disk """
+    start = time.perf_counter()
+    folder = quantized_cache_dir(model_id, model_revision(model_id) or 'local')
+    for name in QUANTIZED_MODULES:
+        module = quantize_module(getattr(pipe, name))
+        setattr(pipe, name, module)
+        path = os.path.join(folder, f"{name}.pt")
+        torch.save(module, path + '.tmp')
+        os.replace(path + '.tmp', path)
+    log_callback(f"Quantized {', '.join(QUANTIZED_MODULES)} to int8 in {time.perf_counter() - start:.0f}s "
+                 f"(cached in {folder})")
+    return pipe
+
+
+def _drift(a, b):
+    diff = ImageStat.Stat(ImageChops.difference(a, b))
+    mae = sum(diff.mean) / len(diff.mean)
+    mse = sum(v * v for v in diff.rms) / len(diff.rms)
+    psnr = 10 * math.log10(255.0 ** 2 / mse) if mse else float('inf')
+    return mae, psnr
+
+def compare_quantized_drift(engine, image=None, prompt=DRIFT_PROMPT, steps=DRIFT_STEPS, seed=DRIFT_SEED, log_callback=print):
+    """
+    Runs the same seeded edit with the full and the int8 tier and reports how far the
+    quantized output drifts (mean absolute difference 0-255, PSNR) and the step time of each.
+    """
+    image = image or Image.effect_noise((512, 512), 64).convert('RGB')
+    previous = engine.quality_tier
+    outputs, timings = {}, {}
+    try:
+        for tier in QUALITY_TIERS:
+            engine.configure_quality(tier)
+            engine._load_edit_model()
+            start = time.perf_counter()
+            outputs[tier] = engine.edit_frame(image, prompt, steps=steps, seed=seed)
+            timings[tier] = (time.perf_counter() - start) / steps
+    finally:
+        engine.configure_quality(previous)
+
+    mae, psnr = _drift(outputs['full'], outputs['int8'])
+    report = {
+        'mean_abs_diff': round(mae, 2), 'psnr': round(psnr, 2),
+        'full_sec_per_step': round(timings['full'], 3), 'int8_sec_per_step': round(timings['int8'], 3),
+        'speedup': round(timings['full'] / timings['int8'], 2) if timings['int8'] else 0.0,
+    }
+    log_callback(f"int8 drift vs full: MAE {report['mean_abs_diff']}/255, PSNR {report['psnr']} dB, "
+                 f"{report['speedup']}x step speed ({report['int8_sec_per_step']} vs {report['full_sec_per_step']} s/step)")
+    return report
@@ -0,0 +1,156 @@
+import math
+import threading
+
+from PIL import Image
+
+BUCKET_MULTIPLE = 64
+# Long side / short side ratios every bucket tier offers (portrait buckets are the transposes)
+BUCKET_ASPECTS = (1.0, 4 / 3, 3 / 2, 16 / 9)
+EDIT_BUCKET_SIDES = (512, 768)
+# Pad mode may shrink an image this much when no bucket holds it at full size; it never enlarges
+MIN_BUCKET_SCALE = 0.85
+
+def bucket_sizes(long_sides, aspects=BUCKET_ASPECTS, multiple=BUCKET_MULTIPLE):
+    """
+    (width, height) buckets: landscape and portrait for every long side and aspect ratio.
+    The short side is side / aspect rounded UP to the multiple, so an image of that aspect ratio
+    fits at the full long side (e.g. 512 at 16:9 -> 288 -> 512x320; duplicates are dropped).
+    """
+    sizes = []
+    for side in long_sides:
+        for aspect in aspects:
+            short = max(multiple, math.ceil(side / aspect / multiple) * multiple)
+            for size in ((side, short), (short, side)):
+                if size not in sizes:
+                    sizes.append(size)
+    return sizes
+
+def _pad_edges(image, size, offset):
+    """ Places image at offset on a size canvas and fills the border by stretching the outermost pixels """
+    canvas = Image.new(image.mode, size)
+    canvas.paste(image, offset)
+    left, top = offset
+    right, bottom = left + image.width, top + image.height
+    if left:
+        canvas.paste(image.crop((0, 0, 1, image.height)).resize((left, image.height)), (0, top))
+    if right < size[0]:
+        canvas.paste(image.crop((image.width - 1, 0, image.width, image.height)).resize((size[0] - right, image.height)), (right, top))
+    if top:
+        canvas.paste(canvas.crop((0, top, size[0], top + 1)).resize((size[0], top)), (0, 0))
+    if bottom < size[1]:
+        canvas.paste(canvas.crop((0, bottom - 1, size[0], bottom)).resize((size[0], size[1] - bottom)), (0, bottom))
+    return canvas
+
+
+class ResolutionBucketer:
+    """
+    Maps arbitrary image sizes onto a small fixed set of resolutions, so compiled UNets,
+    exported ONNX graphs and allocator pools see the same shapes again and again.
+    - sizes: (width, height) buckets, multiples of 64.
+    - mode: 'pad' places the image (never enlarged) in a bucket and fills the border with its edge
+      pixels (restore crops it off again); 'crop' scales it to cover a bucket and center-crops
+      (restore only resizes back).
+    A bucket becomes warm after its first inference (mark_warm); the hit rate counts lookups
+    that landed on a warm bucket.
+    """
+    def __init__(self, name, sizes, mode="pad"):
+        if mode not in ("pad", "crop"):
+            raise ValueError(f"Unknown bucket mode '{mode}'")
+        self.name = name
+        self.sizes = list(sizes)
+        self.mode = mode
+        self.stats = {}     # bucket -> {'hits': lookups, 'warm': bool}
+        self.lookups = 0
+        self.warm_hits = 0
+        self._lock = threading.Lock()
+
+    def _scale(self, size, bucket):
+        """ Resize factor of an image placed in a bucket """
+        width, height = size
+        if self.mode == "pad":
+            return min(1.0, bucket[0] / width, bucket[1] / height)
+        return max(bucket[0] / width, bucket[1] / height)
+
+    def choose(self, size):
+        """
+        The bucket for a (width, height).
+        - pad: the smallest bucket that holds the image at full size (closest aspect ratio on ties);
+          if none does, the smallest one that holds it shrunk to >= MIN_BUCKET_SCALE; else the
+          bucket that shrinks it least.
+        - crop: the smallest long side that holds the image (else the largest), then the aspect
+          ratio that crops the least.
+        """
+        width, height = size
+        if self.mode == "pad":
+            def aspect_gap(bucket):
+                return abs(math.log(bucket[0] / bucket[1]) - math.log(width / height))
+            fitting = [b for b in self.sizes if self._scale(size, b) >= MIN_BUCKET_SCALE]
+            if fitting:
+                return min(fitting, key=lambda b: (self._scale(size, b) < 1, b[0] * b[1], aspect_gap(b)))
+            return max(self.sizes, key=lambda b: (self._scale(size, b), -b[0] * b[1]))
+
+        sides = sorted({max(s) for s in self.sizes})
+        side = next((s for s in sides if s >= max(width, height)), sides[-1])
+
+        def waste(bucket):
+            # Share of the scaled image that is cropped away
+            scale = self._scale(size, bucket)
+            return 1 - (bucket[0] * bucket[1]) / ((width * scale) * (height * scale))
+        return min((s for s in self.sizes if max(s) == side), key=waste)
+
+    def fit(self, image):
+        """ Returns (bucketed image, placement); pass the placement to restore() """
+        bucket = self.choose(image.size)
+        with self._lock:
+            entry = self.stats.setdefault(bucket, {'hits': 0, 'warm': False})
+            entry['hits'] += 1
+            self.lookups += 1
+            self.warm_hits += entry['warm']
+
+        width, height = image.size
+        scale = self._scale(image.size, bucket)
+        scaled = (max(1, round(width * scale)), max(1, round(height * scale)))
+        resized = image if scaled == image.size else image.resize(scaled, Image.Resampling.LANCZOS)
+        offset = ((bucket[0] - scaled[0]) // 2, (bucket[1] - scaled[1]) // 2)
+
+        if self.mode == "pad":
+            fitted = resized if scaled == bucket else _pad_edges(resized, bucket, offset)
+            box = (offset[0], offset[1], offset[0] + scaled[0], offset[1] + scaled[1])
+        else:
+            left, top = -offset[0], -offset[1]
+            fitted = resized.crop((left, top, left + bucket[0], top + bucket[1]))
+            box = (0, 0) + bucket
+        return fitted, {'bucket': bucket, 'size': image.size, 'box': box}
+
+    def restore(self, image, placement):
+        """ The model output for a fitted image, back at the original size """
+        if image.size != placement['bucket']:
+            image = image.resize(placement['bucket'], Image.Resampling.LANCZOS)
+        if placement['box'] != (0, 0) + placement['bucket']:
+            image = image.crop(placement['box'])
+        if image.size != placement['size']:
+            image = image.resize(placement['size'], Image.Resampling.LANCZOS)
+        return image
+
+    def mark_warm(self, bucket):
+        with self._lock:
+            self.stats.setdefault(bucket, {'hits': 0, 'warm': False})['warm'] = True
+
+    def is_warm(self, bucket):
+        entry = self.stats.get(bucket)
+        return bool(entry and entry['warm'])
+
+    def reset_warm(self):
+        """ Forgets warm state (after the model or backend changed); hit counts are kept """
+        with self._lock:
+            for entry in self.stats.values():
+                entry['warm'] = False
+
+    def summary(self):
+        rate = self.warm_hits / self.lookups * 100 if self.lookups else 0.0
+        used = ', '.join(
+            f"{w}x{h} {entry['hits']}{' warm' if entry['warm'] else ''}"
+            for (w, h), entry in sorted(self.stats.items(), key=lambda item: -item[1]['hits'])
+        ) or 'none'
+        return (f"{self.name} buckets: {self.lookups} lookups ({rate:.0f}% on warm buckets), "
+                f"{len(self.stats)}/{len(self.sizes)} buckets used: {used}")
@@ -9,6 +9,7 @@ try:
 except ImportError:
     setup_ffmpeg = None
 
+from src.core.gpu_utils import start_encoder_probe
 from src.ui.main_window import MainWindow
 
 def show_ffmpeg_error():
@@ -41,7 +42,10 @@ if __name__ == "__main__":
             show_ffmpeg_error()
             sys.exit(1) # Stop the app
     
-    # 4. Launch the Window
+    # 4. Probe encoders in the background (cached on disk, shared by every job)
+    start_encoder_probe()
+
+    # 5. Launch the Window
     window = MainWindow()
     window.show()
     sys.exit(app.exec())
\ No newline at end of file
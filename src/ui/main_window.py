@@ -1,6 +1,6 @@
 import sys
 import os
-import shutil
+import threading
 import time
 
 from PySide6.QtWidgets import (
@@ -13,10 +13,20 @@ from PySide6.QtCore import Qt, QThread, Signal
 from PySide6.QtGui import QIcon, QPixmap
 
 from ..core.generator import VideoGenerator
+from ..core.ai_video import edit_video, is_video_file
+from ..core.frame_similarity import DUPLICATE_THRESHOLD
 
 # Lazy load placeholder
 AIImageEditor = None 
 
+def load_ai_engine():
+    """ Imports torch/diffusers on first use and returns the AIImageEditor singleton """
+    global AIImageEditor
+    if AIImageEditor is None:
+        from ..core.ai_editor import AIImageEditor as AIEngine
+        AIImageEditor = AIEngine
+    return AIImageEditor()
+
 from .styles import DARK_THEME
 
 def resource_path(relative_path):
@@ -40,7 +50,7 @@ class WorkerThread(QThread):
         super().__init__()
         self.mode = mode
         self.kwargs = kwargs
-        self.generator = VideoGenerator()
+        self.generator = VideoGenerator(log_callback=self.log_update.emit)
 
     def run(self):
         try:
@@ -54,14 +64,12 @@ class WorkerThread(QThread):
             # --- VIDEO/IMAGE MODES ---
             elif self.mode == 'create_video':
                 self.log_update.emit("Generating video from image + audio...")
-                self.progress_update.emit(10) 
-                self.generator.generate_video(self.kwargs['img'], self.kwargs['audio'], self.kwargs['output'], self.kwargs['quality'])
+                self.generator.generate_video(self.kwargs['img'], self.kwargs['audio'], self.kwargs['output'], self.kwargs['quality'], progress_callback=self._on_ffmpeg_progress, ladder=self.kwargs.get('ladder'))
                 self.progress_update.emit(100)
 
             elif self.mode == 'upscale_video':
                 self.log_update.emit("Upscaling video (this may take time)...")
-                self.progress_update.emit(10)
-                self.generator.upscale_video(self.kwargs['video'], self.kwargs['output'], self.kwargs['quality'])
+                self.generator.upscale_video(self.kwargs['video'], self.kwargs['output'], self.kwargs['quality'], progress_callback=self._on_ffmpeg_progress, parallel_segments=self.kwargs.get('segments', 1), ladder=self.kwargs.get('ladder'))
                 self.progress_update.emit(100)
 
             elif self.mode == 'upscale_images':
@@ -88,13 +96,16 @@ class WorkerThread(QThread):
             self.log_update.emit(f"ERROR: {str(e)}")
             self.finished.emit(False, f"Error: {e}")
 
+    def _on_ffmpeg_progress(self, percent, fps, speed):
+        self.progress_update.emit(percent)
+        # Log roughly every 10% so the console doesn't flood on long encodes
+        if percent // 10 != getattr(self, '_last_logged_decile', -1):
+            self._last_logged_decile = percent // 10
+            self.log_update.emit(f"Encoding: {percent}% ({fps:.1f} fps, {speed:.2f}x)")
+
     def _load_ai_engine(self):
         self.log_update.emit("Initializing AI Engine... (Check terminal if downloading models)")
-        global AIImageEditor
-        if AIImageEditor is None:
-                from ..core.ai_editor import AIImageEditor as AIEngine
-                AIImageEditor = AIEngine
-        return AIImageEditor()
+        return load_ai_engine()
 
     def run_ai_edit(self):
         input_path = self.kwargs['img'] 
@@ -104,31 +115,26 @@ class WorkerThread(QThread):
         # Get Reference Path
         ref_path = self.kwargs.get('reference_path', None)
         
-        is_video = input_path.lower().endswith(('.mp4', '.avi', '.mov'))
+        is_video = is_video_file(input_path)
         ai_engine = self._load_ai_engine()
+        ai_engine.configure_quality(self.kwargs.get('quality_tier', 'full'))
+        ai_engine.configure_backend(self.kwargs.get('backend', 'torch'))
         self.log_update.emit("AI Model Loaded.")
 
         if is_video:
             # VIDEO MODE (Ref Image support added but will be static on every frame)
-            temp_dir = os.path.join(os.path.dirname(output_path), "temp_frames_ai")
-            self.log_update.emit("Extracting video frames...")
-            frames = self.generator.extract_frames(input_path, temp_dir)
-            total_frames = len(frames)
-            
-            for i, frame_path in enumerate(frames):
-                self.log_update.emit(f"AI Edit: Frame {i+1}/{total_frames}")
-                ai_engine.edit_image(
-                    frame_path, prompt, frame_path, 
-                    steps=10, 
-                    image_guidance_scale=img_scale,
-                    reference_path=ref_path # Pass ref here
-                )
-                progress = int(((i + 1) / total_frames) * 100)
-                self.progress_update.emit(progress)
-            
-            self.log_update.emit("Reassembling video...")
-            self.generator.frames_to_video(temp_dir, input_path, output_path)
-            if os.path.exists(temp_dir): shutil.rmtree(temp_dir)
+            edit_video(
+                ai_engine, self.generator, input_path, output_path, prompt,
+                image_guidance_scale=img_scale,
+                reference_path=ref_path, # Pass ref here
+                process_fps=self.kwargs.get('process_fps'),
+                edit_every=self.kwargs.get('edit_every', 1),
+                adaptive_anchors=self.kwargs.get('adaptive_anchors', False),
+                checkpoint=self.kwargs.get('checkpoint', False),
+                duplicate_threshold=self.kwargs.get('duplicate_threshold'),
+                progress_callback=lambda done, total: self.progress_update.emit(int(done / total * 100)),
+                log_callback=self.log_update.emit
+            )
             
         else:
             # IMAGE MODE
@@ -143,6 +149,44 @@ class WorkerThread(QThread):
                 reference_path=ref_path, # Pass ref here
                 status_callback=callback
             )
+            self.log_update.emit(ai_engine.prompt_cache.summary())
+            self.log_update.emit(ai_engine.image_cache.summary())
+            self.log_update.emit(ai_engine.edit_buckets.summary())
+
+
+class WarmUpThread(QThread):
+    """ Loads the edit model and pre-computes the selected image's latents while the user types """
+    log_update = Signal(str)
+
+    def __init__(self, image_path, reference_path, cancel_event, quality_tier="full", backend="torch"):
+        super().__init__()
+        self.image_path = image_path
+        self.reference_path = reference_path
+        self.cancel_event = cancel_event
+        self.quality_tier = quality_tier
+        self.backend = backend
+
+    def run(self):
+        try:
+            engine = load_ai_engine()
+            # Warm the variant the next edit will use, so Apply does not unload and reload it
+            engine.configure_quality(self.quality_tier)
+            engine.configure_backend(self.backend)
+            ready = engine.warm_up(self.image_path, self.reference_path, self.cancel_event)
+            if ready:
+                self.log_update.emit("AI warm-up done: model loaded" + (", input image prepared." if self.image_path else "."))
+        except Exception as e:
+            self.log_update.emit(f"AI warm-up skipped: {e}")
+
+
+class UnloadThread(QThread):
+    """ Frees the AI models off the GUI thread (the engine lock may be held by a running job) """
+    log_update = Signal(str)
+
+    def run(self):
+        engine = AIImageEditor()
+        engine.unload()
+        self.log_update.emit(engine.models.summary())
 
 
 class MainWindow(QMainWindow):
@@ -165,6 +209,9 @@ class MainWindow(QMainWindow):
         self.ai_input_path = None
         self.ai_output_path = None
         self.ai_reference_path = None # New Variable
+        self.warmup_cancel = None
+        self.warmup_threads = set()
+        self.unload_thread = None
 
         self.setup_ui()
         self.setStyleSheet(DARK_THEME)
@@ -233,6 +280,9 @@ class MainWindow(QMainWindow):
         layout.addWidget(QLabel("Target Quality:"))
         self.combo_quality_upscale = QComboBox(); self.combo_quality_upscale.addItems(["1080p", "4k", "2k", "720p"])
         layout.addWidget(self.combo_quality_upscale)
+        layout.addWidget(QLabel("Parallel Segments (CPU encoders scale with cores):"))
+        self.combo_segments_upscale = QComboBox(); self.combo_segments_upscale.addItems(["1", "2", "4", "8"])
+        layout.addWidget(self.combo_segments_upscale)
         btn_run = QPushButton("Upscale Video"); btn_run.setFixedHeight(40); btn_run.clicked.connect(self.run_upscale_video)
         layout.addWidget(btn_run); layout.addStretch()
 
@@ -320,6 +370,29 @@ class MainWindow(QMainWindow):
         slider_layout.addWidget(self.lbl_fidelity_val)
         
         cg_layout.addLayout(slider_layout)
+
+        # Video frame rate (lower = fewer frames through the model)
+        fps_layout = QHBoxLayout()
+        fps_layout.addWidget(QLabel("Video: process at"))
+        self.combo_ai_fps = QComboBox(); self.combo_ai_fps.addItems(["Native fps", "24 fps", "15 fps", "12 fps", "8 fps"])
+        fps_layout.addWidget(self.combo_ai_fps)
+        fps_layout.addWidget(QLabel("edit every"))
+        self.combo_ai_every = QComboBox(); self.combo_ai_every.addItems(["1 frame", "2 frames", "4 frames", "8 frames", "Auto (scene-aware)"])
+        fps_layout.addWidget(self.combo_ai_every)
+        self.combo_ai_duplicates = QComboBox(); self.combo_ai_duplicates.addItems(["Edit duplicate frames", "Reuse near-duplicates (lossy)"])
+        fps_layout.addWidget(self.combo_ai_duplicates)
+        cg_layout.addLayout(fps_layout)
+
+        # Quality/speed tier of the edit model (int8 only applies without a CUDA GPU)
+        tier_layout = QHBoxLayout()
+        tier_layout.addWidget(QLabel("Model (CPU):"))
+        self.combo_ai_tier = QComboBox(); self.combo_ai_tier.addItems(["Full quality", "Fast (int8)"])
+        tier_layout.addWidget(self.combo_ai_tier)
+        self.combo_ai_backend = QComboBox(); self.combo_ai_backend.addItems(["PyTorch", "ONNX Runtime"])
+        tier_layout.addWidget(self.combo_ai_backend)
+        self.combo_ai_tier.currentIndexChanged.connect(self._ai_variant_changed)
+        self.combo_ai_backend.currentIndexChanged.connect(self._ai_variant_changed)
+        cg_layout.addLayout(tier_layout)
         control_group.setLayout(cg_layout)
         layout.addWidget(control_group)
 
@@ -330,6 +403,10 @@ class MainWindow(QMainWindow):
         self.btn_run_ai.clicked.connect(self.run_ai_edit)
         layout.addWidget(self.btn_run_ai)
 
+        self.btn_unload_ai = QPushButton("🧹 Free AI Memory (unload models)")
+        self.btn_unload_ai.clicked.connect(self.unload_ai_models)
+        layout.addWidget(self.btn_unload_ai)
+
     def switch_image_mode(self, index): self.stack_img.setCurrentIndex(index)
 
     # --- HANDLERS ---
@@ -361,6 +438,7 @@ class MainWindow(QMainWindow):
             else:
                 pixmap = QPixmap(path).scaled(self.lbl_ai_preview_before.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
                 self.lbl_ai_preview_before.setPixmap(pixmap)
+            self.start_warm_up()
 
     def select_reference_image(self):
         path, _ = QFileDialog.getOpenFileName(self, "Select Reference Object", "", "Images (*.png *.jpg *.jpeg)")
@@ -368,10 +446,37 @@ class MainWindow(QMainWindow):
             self.ai_reference_path = path
             self.btn_ref_image.setText(f"➕ Ref: {os.path.basename(path)}")
             self.btn_ref_image.setStyleSheet("color: #00ff00; border: 1px solid #00ff00;")
+            if self.ai_input_path:
+                self.start_warm_up()
+
+    def start_warm_up(self):
+        """ Starts speculative prep for the current selection and cancels any stale one """
+        if self.warmup_cancel:
+            self.warmup_cancel.set()
+        self.warmup_cancel = threading.Event()
+
+        # Videos are edited frame by frame, so only the model can be warmed up for them
+        image_path = None if is_video_file(self.ai_input_path) else self.ai_input_path
+        thread = WarmUpThread(image_path, self.ai_reference_path, self.warmup_cancel,
+                              self._selected_quality_tier(), self._selected_backend())
+        thread.log_update.connect(self.append_log)
+        thread.finished.connect(lambda: self.warmup_threads.discard(thread))
+        self.warmup_threads.add(thread)
+        thread.start()
+
+    def _ai_variant_changed(self):
+        if self.ai_input_path:
+            self.start_warm_up()
+
+    def _selected_quality_tier(self):
+        return "int8" if self.combo_ai_tier.currentIndex() == 1 else "full"
+
+    def _selected_backend(self):
+        return "onnx" if self.combo_ai_backend.currentIndex() == 1 else "torch"
 
     # --- RUNNERS ---
     def run_create_video(self): self.start_worker('create_video', img=self.image_path, audio=self.audio_path, output=self._save("Video (*.mp4)"), quality=self.combo_quality_video.currentText())
-    def run_upscale_video(self): self.start_worker('upscale_video', video=self.video_input_path, output=self._save("Video (*.mp4)"), quality=self.combo_quality_upscale.currentText())
+    def run_upscale_video(self): self.start_worker('upscale_video', video=self.video_input_path, output=self._save("Video (*.mp4)"), quality=self.combo_quality_upscale.currentText(), segments=int(self.combo_segments_upscale.currentText()))
     def run_concat_images(self): self.start_worker('concat_images', img1=self.concat_img1, img2=self.concat_img2, output=self._save("Image (*.png)"))
     def run_upscale_images(self): 
         folder = QFileDialog.getExistingDirectory(self, "Output Folder")
@@ -394,7 +499,34 @@ class MainWindow(QMainWindow):
                               prompt=self.txt_prompt.text(), 
                               output=save_path,
                               image_guidance_scale=fidelity,
-                              reference_path=self.ai_reference_path) # Pass ref path
+                              reference_path=self.ai_reference_path, # Pass ref path
+                              process_fps=self._selected_process_fps(),
+                              quality_tier=self._selected_quality_tier(),
+                              backend=self._selected_backend(),
+                              duplicate_threshold=DUPLICATE_THRESHOLD if self.combo_ai_duplicates.currentIndex() == 1 else None,
+                              **self._selected_edit_every())
+
+    def unload_ai_models(self):
+        if AIImageEditor is None:
+            self.append_log("No AI models loaded."); return
+        if self.warmup_cancel:
+            self.warmup_cancel.set()
+        self.btn_unload_ai.setEnabled(False)
+        self.append_log("Unloading AI models (waits for any running AI step to finish)...")
+        self.unload_thread = UnloadThread()
+        self.unload_thread.log_update.connect(self.append_log)
+        self.unload_thread.finished.connect(lambda: self.btn_unload_ai.setEnabled(True))
+        self.unload_thread.start()
+
+    def _selected_process_fps(self):
+        text = self.combo_ai_fps.currentText()
+        return None if text.startswith("Native") else int(text.split()[0])
+
+    def _selected_edit_every(self):
+        text = self.combo_ai_every.currentText()
+        if text.startswith("Auto"):
+            return {'edit_every': 8, 'adaptive_anchors': True}
+        return {'edit_every': int(text.split()[0]), 'adaptive_anchors': False}
 
     def _save(self, filter_str):
         path, _ = QFileDialog.getSaveFileName(self, "Save File", "", filter_str)
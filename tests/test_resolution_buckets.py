@@ -0,0 +1,38 @@
+from PIL import Image
+
+from src.core.resolution_buckets import EDIT_BUCKET_SIDES, ResolutionBucketer, bucket_sizes
+
+
+def _edit_bucketer():
+    return ResolutionBucketer("Edit", bucket_sizes(EDIT_BUCKET_SIDES), mode="pad")
+
+
+def test_bucket_sizes_round_short_side_up():
+    sizes = bucket_sizes(EDIT_BUCKET_SIDES)
+    assert (512, 320) in sizes and (512, 256) not in sizes
+    assert len(sizes) == 12
+    assert all(w % 64 == 0 and h % 64 == 0 for w, h in sizes)
+
+
+def test_exact_fit_is_not_shrunk():
+    bucketer = _edit_bucketer()
+    for size in [(768, 512), (768, 576), (512, 512), (448, 768)]:
+        image = Image.new('RGB', size, (10, 200, 30))
+        fitted, placement = bucketer.fit(image)
+        assert placement['bucket'] == size
+        assert fitted.size == size
+        assert placement['box'] == (0, 0) + size
+
+
+def test_pad_prefers_full_size_over_smaller_bucket():
+    bucketer = _edit_bucketer()
+    assert bucketer.choose((640, 480)) == (768, 512)
+    assert bucketer.choose((768, 432)) == (768, 448)
+    assert bucketer.choose((600, 400)) == (768, 448)
+
+
+def test_restore_returns_original_size():
+    bucketer = _edit_bucketer()
+    image = Image.new('RGB', (700, 390), (1, 2, 3))
+    fitted, placement = bucketer.fit(image)
+    assert bucketer.restore(fitted, placement).size == (700, 390)